@@ -3,16 +3,22 @@
 # load necessary packages
 import openpyxl as openpyxl
 import pandas as pd
+import os
+from disclosure_io import read_disclosure_files
+
+# read in datasets (through the parquet cache shared with 02_RenameCol_Rowbind.py)
+DROPBOX_RAW_PATH = "/Users/euniceliu/Dropbox (Dartmouth College)/You-Chi Liu's files/qss20_finalproj_rawdata/summerwork/raw/"
+DISCLOSURE_CACHE_PATH = os.path.join(DROPBOX_RAW_PATH, "../intermediate/disclosure_parquet_cache/")
+disc_files = read_disclosure_files(DROPBOX_RAW_PATH, DISCLOSURE_CACHE_PATH)
+df_2014 = disc_files['df_2014']
+df_2015 = disc_files['df_2015']
+df_2016 = disc_files['df_2016']
+df_2017 = disc_files['df_2017']
+df_2018 = disc_files['df_2018']
+df_2019 = disc_files['df_2019']
+df_2020 = disc_files['df_2020']
+df_2021 = disc_files['df_2021']
 
-# read in datasets
-df_2014 = pd.read_excel("/Users/euniceliu/Dropbox (Dartmouth College)/You-Chi Liu's files/qss20_finalproj_rawdata/summerwork/raw/H_2A_Disclosure_Data_FY2014.xlsx")
-df_2015 = pd.read_excel("/Users/euniceliu/Dropbox (Dartmouth College)/You-Chi Liu's files/qss20_finalproj_rawdata/summerwork/raw/H_2A_Disclosure_Data_FY2015.xlsx")
-df_2016 = pd.read_excel("/Users/euniceliu/Dropbox (Dartmouth College)/You-Chi Liu's files/qss20_finalproj_rawdata/summerwork/raw/H_2A_Disclosure_Data_FY2016.xlsx")
-df_2017 = pd.read_excel("/Users/euniceliu/Dropbox (Dartmouth College)/You-Chi Liu's files/qss20_finalproj_rawdata/summerwork/raw/H_2A_Disclosure_Data_FY2017.xlsx")
-df_2018 = pd.read_excel("/Users/euniceliu/Dropbox (Dartmouth College)/You-Chi Liu's files/qss20_finalproj_rawdata/summerwork/raw/H_2A_Disclosure_Data_FY2018.xlsx")
-df_2019 = pd.read_excel("/Users/euniceliu/Dropbox (Dartmouth College)/You-Chi Liu's files/qss20_finalproj_rawdata/summerwork/raw/H_2A_Disclosure_Data_FY2019.xlsx")
-df_2020 = pd.read_excel("/Users/euniceliu/Dropbox (Dartmouth College)/You-Chi Liu's files/qss20_finalproj_rawdata/summerwork/raw/H_2A_Disclosure_Data_FY2020.xlsx")
-df_2021 = pd.read_excel("/Users/euniceliu/Dropbox (Dartmouth College)/You-Chi Liu's files/qss20_finalproj_rawdata/summerwork/raw/H_2A_Disclosure_Data_FY2021.xlsx")
 # combine into a list
 full_data = [df_2014, df_2015, df_2016, df_2017, df_2018, df_2019, df_2020, df_2021]
 
@@ -5,7 +5,7 @@
 ##################
 
 ############## Imports and functions
-from census import Census
+from acs_pull import pull_acs_tracts
 import pandas as pd
 import os
 from os import listdir
@@ -16,14 +16,16 @@ import argparse
 
 
 ## Define script-levels args of year
-my_parser = argparse.ArgumentParser(description='Pull a specific ACS year')
+my_parser = argparse.ArgumentParser(description='Pull one or more ACS years')
 my_parser.add_argument('--dropbox', help = "Path to summer work Dropbox directory")
-my_parser.add_argument('--acsyear', type = int, help = "integer with year of ACS data to pull")
+my_parser.add_argument('--acsyear', type = int, nargs = '+', help = "integer(s) with year(s) of ACS data to pull")
+my_parser.add_argument('--workers', type = int, default = 8, help = "number of (year, state) pulls run at once")
+my_parser.add_argument('--requests_per_minute', type = int, default = 120, help = "cap on Census API requests per minute (every variable chunk of a pull, and every retry, counts)")
 args = my_parser.parse_args()
 #DROPBOX_DATA_PATH = my_parser.parse_args(sys.argv[1:]).DROPBOX_DIR
 #YEAR = my_parser.parse_args(sys.argv[1:]).YEAR
 DROPBOX_DATA_PATH = args.dropbox
-YEAR = args.acsyear
+YEARS = args.acsyear
 #print(DROPBOX_DATA_PATH)
 #print(YEAR)
 
@@ -45,6 +47,8 @@ ACS_PREDICTORS_PATHNAME = os.path.join(DROPBOX_INT_PATH,
                                        ACS_PREDICTORS_FILENAME)
 print(ACS_PREDICTORS_PATHNAME)
 ACS_WRITEFOLDER = os.path.join(DROPBOX_RAW_PATH, "ACS_TRACT_DEMOGRAPHICS/")
+## each (year, state) response is cached here so a failed pull resumes
+ACS_CACHEFOLDER = os.path.join(ACS_WRITEFOLDER, "pull_cache/")
 TESTING_PULL = False
 
 
@@ -53,20 +57,6 @@ TESTING_PULL = False
 
 ## API key 
 censuskey = "8105419cada33ca0aaa48b111b8c44b9484e286a"
-c = Census(censuskey)
-
-def demographics(variables_list, fips_list, year = YEAR):
-    
-    list_of_dfs = [pd.DataFrame(c.acs5.state_county_tract(variables_list,
-                                                          state_fips=fip,
-                                                          year = year,
-                                                          county_fips=Census.ALL,
-                                                          tract=Census.ALL))
-                   for fip in fips_list]
-    
-    full_df = pd.concat(list_of_dfs)
-                   
-    return full_df
 
 
 
@@ -76,19 +66,11 @@ fips_url = 'https://gist.githubusercontent.com/dantonnoriega/bf1acd2290e15b91e67
 state_fips = pd.read_csv(fips_url)
 state_fips = state_fips.rename(columns = {'stname': 'name', ' st': 'fip', ' stusps': 'abbr'})
 
-fips = state_fips['fip'].astype(str)
+fips = state_fips['fip'].astype(str).str.strip().str.zfill(2)
 if TESTING_PULL:
-    fips_list = fips[0]
+    fips_list = fips[0:1].tolist()
 else:
-    fips_list = fips
-
-
-# In[4]:
-
-
-for i in range(0, len(fips)):
-    if len(fips[i]) < 2:
-        fips[i] = '0' + fips[i]
+    fips_list = fips.tolist()
 
 
 ############## Load data with names of ACS variables 
@@ -108,17 +90,16 @@ variables_list = ['NAME', 'B05006_123E'] + variables_list
 
 
 
-############# Use Census API to pull at the tract level for all fips codes
+############# Use Census API to pull at the tract level for all (year, fips) pairs
 start_pull = time.time()
 print("starting ACS pull at: " + str(start_pull))
 
-all_dem = demographics(variables_list, fips_list = fips_list)
+all_dem_by_year = pull_acs_tracts(YEARS, fips_list, variables_list, censuskey, ACS_CACHEFOLDER,
+                                  max_workers = args.workers,
+                                  requests_per_minute = args.requests_per_minute)
 end_pull = time.time()
 print("finished pull at: " + str(end_pull))
 
-all_dem.to_pickle(ACS_WRITEFOLDER + "acs_dem_year_" + str(YEAR) + ".pkl")
-print("wrote pull")
-
-
-
-
+for year, all_dem in all_dem_by_year.items():
+    all_dem.to_pickle(ACS_WRITEFOLDER + "acs_dem_year_" + str(year) + ".pkl")
+    print("wrote pull for " + str(year))
@@ -1,8 +1,6 @@
 #!/usr/bin/python bash
-for i in {2014..2019}
-do
-	python3 04_acs_demographics_percentage.py --dropbox "/Users/euniceliu/Dropbox (Dartmouth College)/qss20_finalproj_rawdata/summerwork/" --acsyear $i
-done
+## all years are built in one run (one worker process per year)
+python3 04_acs_demographics_percentage.py --dropbox "/Users/euniceliu/Dropbox (Dartmouth College)/qss20_finalproj_rawdata/summerwork/" --acsyear 2014 2015 2016 2017 2018 2019
 
 
 
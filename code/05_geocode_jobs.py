@@ -5,6 +5,10 @@ import pickle5 as pickle
 import pandas as pd
 import clients
 from geocodio import GeocodioClient
+from disclosure_io import read_h2a_dataset
+from geocode_cache import GeocodeCache, GEOCODE_FIELDS
+from geocode_batches import geocode_batches
+from address_utils import create_full_address
 import clients
 import datetime
 
@@ -17,33 +21,22 @@ client = GeocodioClient(key)
 ## Define pathname parameter
 ## going two-levels up from the current directory which is nested within Dropbox
 DROPBOX_INT_PATH = "../../qss20_finalproj_rawdata/summerwork/intermediate/"
-DATA_FILE_NAME = "h2a_combined_2014-2021.pkl"
+DATA_FILE_NAME = "h2a_combined_2014-2021_dataset/"
 DATA_FILE_PATH = os.path.join(DROPBOX_INT_PATH, DATA_FILE_NAME)
 ###### local path for testing
-DATA_FILE_PATH = "/Users/Firstclass/Dropbox (Dartmouth College)/qss20_finalproj_rawdata/summerwork/intermediate/h2a_combined_2014-2021.pkl"
+DATA_FILE_PATH = "/Users/Firstclass/Dropbox (Dartmouth College)/qss20_finalproj_rawdata/summerwork/intermediate/h2a_combined_2014-2021_dataset/"
+## persistent cache of geocoded addresses, entries are re-geocoded after GEOCODE_CACHE_TTL_DAYS
+## (addresses that got no result are retried after GEOCODE_CACHE_NEGATIVE_TTL_DAYS)
+GEOCODE_CACHE_PATH = "/Users/Firstclass/Dropbox (Dartmouth College)/qss20_finalproj_rawdata/summerwork/intermediate/geocode_cache.sqlite"
+GEOCODE_CACHE_TTL_DAYS = 365
+GEOCODE_CACHE_NEGATIVE_TTL_DAYS = 14
+## number of batches sent to Geocodio at once, and cap on batch requests per minute
+GEOCODE_WORKERS = 4
+GEOCODE_REQUESTS_PER_MINUTE = 60
 
 
 
 ## Functions define
-def create_address_from(address, city, state, zip):
-    return handle_null(address) + ", " + handle_null(city) + " " + handle_null(state) + " " + handle_null(str(zip))
-
-
-def handle_null(object):
-    if isinstance(object, float):
-        if object < 0:
-            return ""
-    elif isinstance(object, datetime.date):
-        return ""
-    elif isinstance(object, int):
-        if object < 0:
-            return""
-    elif len(object) == 0:
-        return ""
-
-    return str(object)
-
-
 def split_into_parts(a_list, max_items_per_part):
     if len(a_list) < max_items_per_part:
         return [a_list]
@@ -63,7 +56,7 @@ def split_into_parts(a_list, max_items_per_part):
         return res
 
 
-def geocode_table(df, testing=True, test_size=100):
+def geocode_table(df, testing=True, test_size=100, cache=None, checkpoint_dir=None):
     print(f"Geocoding start...")
 
     start = timeit.default_timer()
@@ -74,56 +67,52 @@ def geocode_table(df, testing=True, test_size=100):
             print(f"This is a test, sample size is {test_size}")
             df = df[:test_size]
 
-        addresses = df.apply(
-        lambda df2: create_address_from(df2["EMPLOYER_ADDRESS1"], df2["EMPLOYER_CITY"], df2["EMPLOYER_STATE"], df2["EMPLOYER_POSTAL_CODE"]), axis=1).tolist()
-        df[f"EMPLOYER_FULLADDRESS"] = addresses
+        ## addresses are normalized (case, punctuation, USPS suffixes, 5-digit zip) so
+        ## near-identical addresses dedup to one geocoding request
+        df = df.copy()
+        df[f"EMPLOYER_FULLADDRESS"] = create_full_address(df, "EMPLOYER_ADDRESS1", "EMPLOYER_CITY",
+                                                          "EMPLOYER_STATE", "EMPLOYER_POSTAL_CODE")
+        addresses = df[f"EMPLOYER_FULLADDRESS"]
 
-        dedup_addr = list(set(addresses))
+        dedup_addr = addresses.unique().tolist()
         print (f"length of original: {len(addresses)}")
         print (f"after removing duplicates : {len(dedup_addr)}")
 
-        addresses_split = split_into_parts(dedup_addr, 9999)
-        geocoding_results = []
-        for these_addresses in addresses_split:
-            if(len(these_addresses)>0):
-                geocoding_results += client.geocode(these_addresses)
-        assert len(geocoding_results) == len(dedup_addr)
+        ## only addresses that aren't in the persistent cache are sent to Geocodio
+        cached = cache.lookup(dedup_addr) if cache is not None else {}
+        to_geocode = [addr for addr in dedup_addr if addr not in cached]
+        print (f"found in geocode cache : {len(cached)}, to geocode : {len(to_geocode)}")
+
+        ## several 9,999-address batches are kept in flight at once; each finished batch is
+        ## written to the cache (or checkpoint_dir) right away so a crashed run resumes
+        addresses_split = split_into_parts(to_geocode, 9999)
+        new_results = geocode_batches(addresses_split, client.geocode,
+                                      max_workers=GEOCODE_WORKERS,
+                                      requests_per_minute=GEOCODE_REQUESTS_PER_MINUTE,
+                                      checkpoint_dir=checkpoint_dir,
+                                      on_batch_done=cache.store if cache is not None else None)
+        assert len(new_results) == len(to_geocode)
+        all_results = {**cached, **new_results}
 
         df_addr = pd.DataFrame(dedup_addr,columns =['EMPLOYER_FULLADDRESS'])
-        latitudes, longitudes, accuracies, accuracy_types, i = [], [], [], [], 0
-        for result in geocoding_results:
-            try:
-                results = result['results'][0]
-                accuracies.append(results['accuracy'])
-                accuracy_types.append(results['accuracy_type'])
-                latitudes.append(results['location']['lat'])
-                longitudes.append(results['location']['lng'])
-            except:
-                accuracies.append(None)
-                accuracy_types.append(None)
-                latitudes.append(None)
-                longitudes.append(None)
-            i += 1
-
-        #i = len(df.columns)
-        df_addr[f"geo_lat"] = latitudes
-        df_addr[f"geo_long"] = longitudes
-        df_addr[f"geo_accuracy"] = accuracies
-        df_addr[f"geo_accuracy_type"] = accuracy_types
+        for field in GEOCODE_FIELDS:
+            df_addr[field] = [all_results[addr][field] for addr in dedup_addr]
 
     dfinal = pd.merge(df, df_addr, on="EMPLOYER_FULLADDRESS", how="left")
     dfinal = dfinal.set_index(df.index)
 
     stop = timeit.default_timer()
     print('Runtime (sec): ', stop - start)
+    if cache is not None:
+        cache.report()
 
     return dfinal
 
 ## Read in data
 # using relative path name
 print("Read in h2a data...")
-with open(DATA_FILE_PATH, "rb") as df:
-  h2a_data = pickle.load(df)
+## columns common across years; pass years = [...] to only load some data_source partitions
+h2a_data = read_h2a_dataset(DATA_FILE_PATH, variant = "commoncols")
 
 print(len(h2a_data))
 
@@ -131,7 +120,10 @@ print(len(h2a_data))
 print("Testing with 100 samples:")
 #test_df1 = geocode_table(h2a_data)
 print("Testing with larger samples:")
-test_df2 = geocode_table(h2a_data, testing=False) # 10000 samples, time used:  294.22878647100003 sec
+geocode_cache = GeocodeCache(GEOCODE_CACHE_PATH, ttl_days=GEOCODE_CACHE_TTL_DAYS,
+                             negative_ttl_days=GEOCODE_CACHE_NEGATIVE_TTL_DAYS)
+test_df2 = geocode_table(h2a_data, testing=False, cache=geocode_cache) # 10000 samples, time used:  294.22878647100003 sec
+geocode_cache.close()
 
 DATA_SAVE_PATH = "/Users/Firstclass/Dropbox (Dartmouth College)/qss20_finalproj_rawdata/summerwork/intermediate/h2a_combined_2014-2021_geocoded.pkl"
 
@@ -9,6 +9,7 @@ import geopandas as gpd
 from geopandas.tools import sjoin
 import sys
 import argparse
+from acs_features import read_acs_features, AcsJoin
 
 ## define pathnames
 dropbox_general = "/Users/euniceliu/Dropbox (Dartmouth College)/"
@@ -18,37 +19,25 @@ DATA_RAW_DIR = os.path.join(DROPBOX_DATA_PATH, "raw/")
 DATA_ID_DIR = os.path.join(DROPBOX_DATA_PATH, "intermediate/")
 PREDICTORS_WRITEFOLDER = os.path.join(DATA_ID_DIR)
 JOBS_INTERSECT_PATH = os.path.join(DATA_ID_DIR, "h2a_tract_intersections.pkl")
-DF_ACS_PATH_2014 = os.path.join(DATA_ID_DIR, "acs_tract_percentage2014.pkl")
-DF_ACS_PATH_2015 = os.path.join(DATA_ID_DIR, "acs_tract_percentage2015.pkl")
-DF_ACS_PATH_2016 = os.path.join(DATA_ID_DIR, "acs_tract_percentage2016.pkl")
-DF_ACS_PATH_2017 = os.path.join(DATA_ID_DIR, "acs_tract_percentage2017.pkl")
-DF_ACS_PATH_2018 = os.path.join(DATA_ID_DIR, "acs_tract_percentage2018.pkl")
-DF_ACS_PATH_2019 = os.path.join(DATA_ID_DIR, "acs_tract_percentage2019.pkl")
+## all ACS years' tract features, written by 04_acs_demographics_percentage.py
+ACS_FEATURES_PATH = os.path.join(DATA_ID_DIR, "acs_tract_features/")
+
+## only these job columns are used downstream (10_construct_outcomes.R)
+JOB_KEEP_COLS = ["CASE_NUMBER", "EMPLOYER_FULLADDRESS", "GEO_ID", "data_source"]
 
 ## read in dataset
 tract_intersect_id = pd.read_pickle(JOBS_INTERSECT_PATH)
-df_acs_2014 = pd.read_pickle(DF_ACS_PATH_2014)
-df_acs_2015 = pd.read_pickle(DF_ACS_PATH_2015)
-df_acs_2016 = pd.read_pickle(DF_ACS_PATH_2016)
-df_acs_2017 = pd.read_pickle(DF_ACS_PATH_2017)
-df_acs_2018 = pd.read_pickle(DF_ACS_PATH_2018)
-df_acs_2019 = pd.read_pickle(DF_ACS_PATH_2019)
-
-## add year's column
-df_acs_2014['data_source']='file_2014'
-df_acs_2015['data_source']='file_2015'
-df_acs_2016['data_source']='file_2016'
-df_acs_2017['data_source']='file_2017'
-df_acs_2018['data_source']='file_2018'
-df_acs_2019['data_source']='file_2019'
+acs_features = read_acs_features(ACS_FEATURES_PATH, years=range(2014, 2020))
 
 ## rename GEOID to GEO_ID in job tract data for merging purpose
 tract_intersect_id = tract_intersect_id.rename(columns={'GEOID': 'GEO_ID'})
+job_years = tract_intersect_id.data_source.astype(str).str.extract(r"(\d{4})", expand=False)
 
-## drop columns in job tract data
-tract_intersect_id.drop(["geo_lat","geo_long", "geo_accuracy", "geo_accuracy_type", "geometry", "index_right", "INTPTLAT", "INTPTLON" ,"AWATER","ALAND"], axis=1, inplace=True)
-
-## merge 2014-2019 acs data
-combined_acs = pd.concat([df_acs_2014, df_acs_2015, df_acs_2016, df_acs_2017, df_acs_2018, df_acs_2019])
-job_with_acs = tract_intersect_id.merge(combined_acs, on= ["data_source", "GEO_ID"], how="left")
-job_with_acs.to_csv(PREDICTORS_WRITEFOLDER + "job_combined_acs_premerging" + ".csv")
+## look up each job's (year, tract) row in the 2014-2019 acs data by integer code,
+## then gather the acs columns for the jobs (jobs from other years or without a
+## tract get NaN, as with the old left merge)
+acs_join = AcsJoin(acs_features, job_years, tract_intersect_id.GEO_ID)
+print(str(round(100 * acs_join.match_rate(), 1)) + "% of jobs matched to an ACS tract-year")
+job_with_acs = pd.concat([tract_intersect_id[JOB_KEEP_COLS].reset_index(drop=True),
+                          acs_join.block()], axis=1)
+job_with_acs.to_parquet(PREDICTORS_WRITEFOLDER + "job_combined_acs_premerging" + ".parquet", index=False)
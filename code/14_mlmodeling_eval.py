@@ -26,6 +26,8 @@ from sklearn.tree import DecisionTreeClassifier
 from sklearn.model_selection import GroupShuffleSplit
 from sklearn.utils import resample
 
+from ml_preprocessing import load_split
+
 ## modeling functions 
 def get_metrics(y_test, y_predicted):
     '''generate evaluation scores accroding predicted y'''
@@ -105,8 +107,9 @@ assert len(model_list) == len(model_list_names)
 ## define paths and read in data
 DROPBOX_YOUR_PATH = "Dropbox/qss20_finalproj_rawdata/summerwork/"
 MODEL_OUTPUT_PATH = "Dropbox/qss20_s21_proj/output/model_outputs/"
-whd_train_init = pd.read_pickle(DROPBOX_YOUR_PATH + "clean/whd_training.pkl")
-whd_test = pd.read_pickle(DROPBOX_YOUR_PATH + "clean/whd_testing.pkl")
+## CSR features and their id/outcome rows (feature_row is each row's row of the features)
+features_train, whd_train_init = load_split(DROPBOX_YOUR_PATH + "clean/whd_training")
+features_test, whd_test = load_split(DROPBOX_YOUR_PATH + "clean/whd_testing")
 focal_outcome = "outcome_is_investigation_overlapsd" 
 
 ## upsample minority class in training
@@ -121,15 +124,10 @@ df_minority_upsamp = resample(df_minority,
 whd_train = pd.concat([df_majority, df_minority_upsamp])
 
 
-## remove non-pverlapping features
-id_cols = ['jobs_group_id', "merge_index", "index", "jobs_row_id", "level_0"]
-common_cols = set(whd_train.columns).intersection(set(whd_test.columns)).difference(id_cols)
-
 ## then, subset to each, separate out outcome var, 
 ## and work on code inside
-outcomes_WHD = [col for col in whd_train if "outcome" in col]
-X_train = whd_train[[col for col in whd_train.columns if col not in outcomes_WHD and col in common_cols]].copy()
-X_test = whd_test[[col for col in whd_test.columns if col not in outcomes_WHD and col in common_cols]].copy()
+X_train = features_train[whd_train.feature_row.to_numpy()]
+X_test = features_test[whd_test.feature_row.to_numpy()]
 y_train = whd_train[[focal_outcome]].copy().iloc[:, 0].to_numpy()
 y_test = whd_test[[focal_outcome]].copy().iloc[:, 0].to_numpy()
 
@@ -26,6 +26,8 @@ from sklearn.tree import DecisionTreeClassifier
 from sklearn.model_selection import GroupShuffleSplit
 from sklearn.utils import resample
 
+from ml_preprocessing import FeaturePreprocessor, load_split
+
 ## modeling functions 
 def get_metrics(y_test, y_predicted):
     '''generate evaluation scores accroding predicted y'''
@@ -50,7 +52,7 @@ def estimate_models(model_list, model_list_names, X_train, y_train, X_test, y_te
         else:
             fi = one_model.coef_
         fi_df = pd.DataFrame({'value': fi[0],
-                         'coef_name': X_train.columns})
+                         'coef_name': preprocessor.feature_names})
         fi_df['model'] = model_list_names[i]
         all_fi.append(fi_df)
 
@@ -69,8 +71,9 @@ assert len(model_list) == len(model_list_names)
 ## define paths and read in data
 DROPBOX_YOUR_PATH = "Dropbox/qss20_finalproj_rawdata/summerwork/"
 MODEL_OUTPUT_PATH = "Dropbox/qss20_s21_proj/output/model_outputs/"
-whd_train_init = pd.read_pickle(DROPBOX_YOUR_PATH + "clean/whd_training.pkl")
-whd_test = pd.read_pickle(DROPBOX_YOUR_PATH + "clean/whd_testing.pkl")
+## CSR features and their id/outcome rows (feature_row is each row's row of the features)
+features_train, whd_train_init = load_split(DROPBOX_YOUR_PATH + "clean/whd_training")
+features_test, whd_test = load_split(DROPBOX_YOUR_PATH + "clean/whd_testing")
 focal_outcome = "outcome_is_investigation_overlapsd" 
 
 ## upsample minority class in training
@@ -85,16 +88,14 @@ df_minority_upsamp = resample(df_minority,
 whd_train = pd.concat([df_majority, df_minority_upsamp])
 
 
-## remove non-pverlapping features
-
-id_cols = ['jobs_group_id', "merge_index", "index", "jobs_row_id", "level_0", "index_x", "index_y"]
-common_cols = set(whd_train.columns).intersection(set(whd_test.columns)).difference(id_cols)
+## train and test have the same features (the ones the preprocessor fitted in 12 outputs);
+## its feature_names name the feature columns
+preprocessor = FeaturePreprocessor.load(DROPBOX_YOUR_PATH + "clean/whd_preprocessor.json")
 
 ## then, subset to each, separate out outcome var, 
 ## and work on code inside
-outcomes_WHD = [col for col in whd_train if "outcome" in col]
-X_train = whd_train[[col for col in whd_train.columns if col not in outcomes_WHD and col in common_cols]].copy()
-X_test = whd_test[[col for col in whd_test.columns if col not in outcomes_WHD and col in common_cols]].copy()
+X_train = features_train[whd_train.feature_row.to_numpy()]
+X_test = features_test[whd_test.feature_row.to_numpy()]
 y_train = whd_train[[focal_outcome]].copy().iloc[:, 0].to_numpy()
 y_test = whd_test[[focal_outcome]].copy().iloc[:, 0].to_numpy()
 
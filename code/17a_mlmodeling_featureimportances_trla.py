@@ -26,6 +26,8 @@ from sklearn.tree import DecisionTreeClassifier
 from sklearn.model_selection import GroupShuffleSplit
 from sklearn.utils import resample
 
+from ml_preprocessing import FeaturePreprocessor, load_split
+
 
 ## get fi
 def get_fi(model_list, model_list_names, X_train, y_train, X_test, y_test):
@@ -42,7 +44,7 @@ def get_fi(model_list, model_list_names, X_train, y_train, X_test, y_test):
         else:
             fi = one_model.coef_
         fi_df = pd.DataFrame({'value': fi[0],
-                         'coef_name': X_train.columns})
+                         'coef_name': preprocessor.feature_names})
         fi_df['model'] = model_list_names[i]
         all_fi.append(fi_df)
 
@@ -67,8 +69,9 @@ assert len(model_list) == len(model_list_names)
 ## define paths and read in data
 DROPBOX_YOUR_PATH = "Dropbox/qss20_finalproj_rawdata/summerwork/"
 MODEL_OUTPUT_PATH = "Dropbox/qss20_s21_proj/output/model_outputs/"
-whd_train_init1 = pd.read_pickle(DROPBOX_YOUR_PATH + "clean/trla_training.pkl")
-whd_test_init1 = pd.read_pickle(DROPBOX_YOUR_PATH + "clean/trla_testing.pkl")
+## CSR features and their id/outcome rows (feature_row is each row's row of the features)
+features_train, whd_train_init1 = load_split(DROPBOX_YOUR_PATH + "clean/trla_training")
+features_test, whd_test_init1 = load_split(DROPBOX_YOUR_PATH + "clean/trla_testing")
 
 ## define outcomes
 trla_outcomes = ['Both TRLA and WHD', 'Neither WHD nor TRLA', 'TRLA; not WHD', 'WHD; not TRLA']
@@ -109,15 +112,14 @@ df_minority_upsamp = resample(df_minority,
 whd_train = pd.concat([df_majority, df_minority_upsamp])
 
 
-## remove non-pverlapping features
-id_cols = ['jobs_group_id', "merge_index", "index", "jobs_row_id", "level_0", "index_x", "index_y"] 
-common_cols = set(whd_train.columns).intersection(set(whd_test.columns)).difference(id_cols)
+## train and test have the same features (the ones the preprocessor fitted in 12 outputs);
+## its feature_names name the feature columns
+preprocessor = FeaturePreprocessor.load(DROPBOX_YOUR_PATH + "clean/trla_preprocessor.json")
 
 ## then, subset to each, separate out outcome var, 
 ## and work on code inside
-all_outcomes = trla_outcomes + [focal_outcome]
-X_train = whd_train[[col for col in whd_train.columns if col not in all_outcomes and col in common_cols]].copy()
-X_test = whd_test[[col for col in whd_test.columns if col not in all_outcomes and col in common_cols]].copy()
+X_train = features_train[whd_train.feature_row.to_numpy()]
+X_test = features_test[whd_test.feature_row.to_numpy()]
 y_train = whd_train[[focal_outcome]].copy().iloc[:, 0].to_numpy()
 y_test = whd_test[[focal_outcome]].copy().iloc[:, 0].to_numpy()
 
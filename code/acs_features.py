@@ -0,0 +1,234 @@
+##################
+# Tract-level ACS features (used by 04_acs_demographics_percentage.py and 07)
+# turns each year's raw ACS pull into one row per tract of percentages and
+# non-percentage variables, for every ACS year in one run, and stores all
+# years as one wide float32 parquet dataset partitioned by year, with the
+# descriptive acs_* column names already attached
+##################
+
+import json
+import multiprocessing
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+## prefix columns that don't follow the total/subgroup pattern, kept as raw values
+VARNAMES_PERCNOTRELEVANT = ['B05004_001E', 'B05004_013E', 'B05004_014E', "B05004_015E", "B06011_001E",
+                            "B19113_001E", "B20004_001E", "B22008_001E", "B24031_002E", "B24041_002E",
+                            "B24121_017E"]
+## percentages dropped from the output
+PERCENTAGES_TO_DROP = ['B01001_002E', 'B01001_026E']
+YEAR_COL = "year"
+## variable -> acs_* name map saved in the dataset directory (pyarrow skips _ files)
+ACS_FEATURES_NAMES = "_acs_names.json"
+
+
+def acs_variable_metadata(acs_variable):
+    '''codebook (predictors_acs_varname.csv) with the E-suffixed names used in the pulls'''
+    acs_variable = acs_variable.copy()
+    acs_variable['name_edit'] = acs_variable.name.astype(str) + "E"
+    return acs_variable
+
+
+def acs_column_names(acs_variable):
+    '''
+    pulled variable (eg B01001_003E) -> descriptive acs_<label>_<concept> name,
+    built the same way 10_construct_outcomes.R used to build it after melting
+    '''
+    acs_variable = acs_variable_metadata(acs_variable)
+    label = acs_variable.label.astype(str).str.replace("Estimate!!Total!!", "", regex=False)
+    label = label.where(acs_variable.label.notna(), "NA")
+    concept = acs_variable.concept.astype(str).str.replace(r"\s+|\(|\)", "_", regex=True)
+    concept = concept.where(acs_variable.concept.notna(), "NA")
+    return dict(zip(acs_variable.name_edit, "acs_" + label + "_" + concept))
+
+
+def name_acs_columns(features, acs_names):
+    '''
+    rename the variable columns to their acs_* names as float32. variables that share a
+    name are averaged (an NA in any of them gives NA), like the dcast mean in 10 did
+    '''
+    names = pd.Index([acs_names.get(col, col) for col in features.columns])
+    values = features.to_numpy(dtype=np.float32)
+    codes, unique_names = pd.factorize(names)
+    if len(unique_names) < len(names):
+        summed = np.zeros((values.shape[0], len(unique_names)), dtype=np.float32)
+        np.add.at(summed.T, codes, values.T)
+        values = summed / np.bincount(codes).astype(np.float32)
+    return pd.DataFrame(values, index=features.index, columns=unique_names)
+
+
+def tract_features(df_acs, acs_variable, tract_geoids):
+    '''
+    one ACS year's pull -> one row per tract with jobs (tract_geoids), indexed by GEO_ID:
+    each variable as a share of its prefix's _001E total, plus the VARNAMES_PERCNOTRELEVANT
+    variables as values (negative codes set to NaN). computed column-wise on the wide
+    pull, without melting. tracts with jobs but no ACS data are kept as empty rows
+    '''
+    tract_geoids = pd.Series(tract_geoids).astype(str)
+
+    ## filter to tracts that have a non_zero count of jobs
+    geo_id = df_acs['GEO_ID'].astype(str).str.replace('1400000US', '', regex=False)
+    has_jobs = geo_id.isin(tract_geoids).to_numpy()
+
+    ## variables in both the codebook and the pull, one row per tract
+    pulled = set(acs_variable.name_edit)
+    pulled = [col for col in df_acs.columns if col in pulled]
+    values = df_acs.loc[has_jobs, pulled].apply(pd.to_numeric, errors='coerce')
+    values = values.groupby(geo_id[has_jobs].to_numpy()).mean()
+    values.index.name = "GEO_ID"
+
+    ## percentages: divide each variable by its prefix's _001E total (a zero total gives NaN)
+    percentage_vars = [col for col in pulled if col not in VARNAMES_PERCNOTRELEVANT]
+    numerators = sorted(col for col in percentage_vars if col.split('_', 1)[1] != "001E")
+    denominators = values[percentage_vars].reindex(columns=[col.split('_', 1)[0] + "_001E"
+                                                            for col in numerators]).to_numpy()
+    percentages = pd.DataFrame(values[numerators].to_numpy() / np.where(denominators == 0, np.nan, denominators),
+                               index=values.index, columns=numerators)
+    percentages = percentages.drop(columns=PERCENTAGES_TO_DROP, errors='ignore')
+
+    ## nonpercentage variables: code <0 to np.nan
+    nonpercentages = values[sorted(col for col in pulled if col in VARNAMES_PERCNOTRELEVANT)]
+    nonpercentages = nonpercentages.where(nonpercentages >= 0)
+
+    ## add back tracts with jobs that have no ACS data
+    features = pd.concat([nonpercentages, percentages], axis=1)
+    missing_tract = tract_geoids[~tract_geoids.isin(features.index)].drop_duplicates()
+    return features.reindex(features.index.append(pd.Index(missing_tract, name="GEO_ID")))
+
+
+def _year_features(year, acs_path_template, acs_variable, tract_geoids, acs_names):
+    start = time.time()
+    df_acs = pd.read_pickle(acs_path_template.format(year=year))
+    features = name_acs_columns(tract_features(df_acs, acs_variable, tract_geoids), acs_names)
+    features = features.reset_index()
+    features[YEAR_COL] = year
+    print("Built ACS " + str(year) + " features for " + str(features.shape[0]) + " tracts in " +
+          str(round(time.time() - start, 1)) + " sec")
+    return features
+
+
+def build_acs_features(years, acs_path_template, acs_variable, tract_geoids, n_workers=None):
+    '''
+    tract_features for every year, with the codebook and tract list loaded once by the
+    caller and each year processed in its own worker process (n_workers defaults to
+    one per year, capped at the cpu count; 1 runs them in this process).
+    acs_path_template is the path to a year's pull with a {year} placeholder.
+    returns one stacked float32 frame with GEO_ID, year and acs_* columns
+    '''
+    acs_names = acs_column_names(acs_variable)
+    acs_variable = acs_variable_metadata(acs_variable)
+    tract_geoids = pd.Series(tract_geoids).astype(str).unique()
+    if n_workers is None:
+        n_workers = min(len(years), os.cpu_count() or 1)
+    if n_workers == 1:
+        by_year = [_year_features(year, acs_path_template, acs_variable, tract_geoids, acs_names)
+                   for year in years]
+    else:
+        ## fork where available so the calling script (which has no __main__ guard)
+        ## isnt re-run inside each worker
+        start_methods = multiprocessing.get_all_start_methods()
+        mp_context = multiprocessing.get_context("fork" if "fork" in start_methods else None)
+        with ProcessPoolExecutor(max_workers=n_workers, mp_context=mp_context) as pool:
+            by_year = list(pool.map(_year_features, years, [acs_path_template] * len(years),
+                                    [acs_variable] * len(years), [tract_geoids] * len(years),
+                                    [acs_names] * len(years)))
+    ## years that lack a variable get NaN for it
+    features = pd.concat(by_year, ignore_index=True)
+    acs_cols = [col for col in features.columns if col not in ("GEO_ID", YEAR_COL)]
+    features[acs_cols] = features[acs_cols].astype(np.float32)
+    return features
+
+
+def write_acs_features(features, dataset_dir, acs_names=None):
+    '''
+    write the stacked features as a parquet dataset partitioned by year, replacing any
+    old one. acs_names (variable -> acs_* name) is saved alongside for reference
+    '''
+    tmp_dir = dataset_dir.rstrip("/") + "_tmp"
+    if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+    features.to_parquet(tmp_dir, partition_cols=[YEAR_COL], index=False)
+    if acs_names is not None:
+        with open(os.path.join(tmp_dir, ACS_FEATURES_NAMES), "w") as f:
+            json.dump(acs_names, f, indent=2)
+    if os.path.exists(dataset_dir):
+        shutil.rmtree(dataset_dir)
+    os.replace(tmp_dir, dataset_dir)
+
+
+def read_acs_features(dataset_dir, years=None, columns=None):
+    '''
+    read the features dataset, optionally only some years and/or acs_* columns;
+    columns are stored wide so nothing needs reshaping
+    '''
+    filters = None if years is None else [(YEAR_COL, "in", [int(year) for year in years])]
+    if columns is not None:
+        columns = ["GEO_ID", YEAR_COL] + [col for col in columns if col not in ("GEO_ID", YEAR_COL)]
+    features = pd.read_parquet(dataset_dir, columns=columns, filters=filters)
+    ## the partition column comes back as a categorical of strings
+    features[YEAR_COL] = features[YEAR_COL].astype(str).astype(int)
+    return features
+
+
+def tract_year_codes(years, geoids):
+    '''
+    one int64 key per (year, 11-digit GEOID): year * 10**11 + GEOID.
+    missing or non-numeric GEOIDs/years get -1
+    '''
+    ## parse only the distinct values, then expand back with the factorize codes
+    year_idx, unique_years = pd.factorize(pd.Series(years).reset_index(drop=True))
+    geoid_idx, unique_geoids = pd.factorize(pd.Series(geoids).reset_index(drop=True))
+    unique_years = pd.to_numeric(pd.Series(unique_years, dtype=object), errors='coerce').to_numpy()
+    unique_geoids = pd.Series(unique_geoids, dtype="string").str.strip()
+    unique_geoids = pd.to_numeric(unique_geoids.where(unique_geoids.str.fullmatch(r"\d{11}", na=False)),
+                                  errors='coerce').to_numpy(dtype=float)
+    ## factorize gives -1 for missing values
+    year_values = np.append(unique_years.astype(float), np.nan)[year_idx]
+    geoid_values = np.append(unique_geoids, np.nan)[geoid_idx]
+    codes = year_values * 10**11 + geoid_values
+    return np.where(np.isnan(codes), -1, codes).astype(np.int64)
+
+
+class AcsJoin:
+    '''
+    ACS features for each job, found by (year, GEOID) code instead of a merge on string
+    keys: the codes are looked up once in the sorted feature codes, which gives each job
+    the position of its tract-year row (-1 if there's none). columns are only gathered
+    (np.take) for the jobs when asked for, one at a time or as a block
+    '''
+
+    def __init__(self, features, job_years, job_geoids):
+        self.features = features
+        feature_codes = tract_year_codes(features[YEAR_COL], features["GEO_ID"])
+        order = np.argsort(feature_codes, kind="stable")
+        sorted_codes = feature_codes[order]
+        job_codes = tract_year_codes(job_years, job_geoids)
+        pos = np.minimum(np.searchsorted(sorted_codes, job_codes), len(sorted_codes) - 1)
+        found = (job_codes >= 0) & (sorted_codes[pos] == job_codes) if len(sorted_codes) else \
+            np.zeros(len(job_codes), dtype=bool)
+        self.rows = np.where(found, order[pos] if len(sorted_codes) else -1, -1)
+
+    @property
+    def acs_columns(self):
+        return [col for col in self.features.columns if col not in ("GEO_ID", YEAR_COL)]
+
+    def match_rate(self):
+        return float((self.rows >= 0).mean()) if len(self.rows) else 0.0
+
+    def column(self, col):
+        '''one ACS column for every job (NaN where the job has no tract-year row)'''
+        values = self.features[col].to_numpy(dtype=np.float32)
+        gathered = np.take(values, np.maximum(self.rows, 0)) if len(values) else \
+            np.full(len(self.rows), np.nan, dtype=np.float32)
+        gathered[self.rows < 0] = np.nan
+        return gathered
+
+    def block(self, columns=None):
+        '''data frame of ACS columns (default all) for every job'''
+        columns = self.acs_columns if columns is None else columns
+        return pd.DataFrame({col: self.column(col) for col in columns})
@@ -0,0 +1,120 @@
+##################
+# Concurrent, cached ACS tract pulls (used by 04_acs_demographics.py)
+# every (year, state) pull is saved to disk as soon as it finishes, keyed by
+# year, state and a hash of the variable list, so a failed run only
+# re-requests the pairs that are still missing
+##################
+
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+
+import pandas as pd
+import requests
+
+from http_utils import RateLimiter, call_with_retries
+
+CENSUS_API_URL = "https://api.census.gov/data"
+## the Census API allows at most 50 variables per request (geography columns don't count)
+MAX_VARIABLES_PER_REQUEST = 49
+GEOGRAPHY_COLS = ["state", "county", "tract"]
+
+
+def variables_hash(variables):
+    '''short hash of the variable list, so changing the variables invalidates the cache'''
+    return hashlib.sha256(",".join(sorted(variables)).encode("utf-8")).hexdigest()[:12]
+
+
+def acs_cache_path(cache_dir, year, state_fips, variables):
+    return os.path.join(cache_dir, "acs5_" + str(year) + "_" + str(state_fips) + "_" +
+                        variables_hash(variables) + ".pkl")
+
+
+def fetch_state_tracts(year, state_fips, variables, api_key, base_url=CENSUS_API_URL,
+                       timeout=300, limiter=None):
+    '''
+    all tracts in one state for one ACS 5-year release, same columns as
+    Census().acs5.state_county_tract. the variables are requested in chunks of
+    MAX_VARIABLES_PER_REQUEST and joined on state/county/tract. with a limiter, every
+    chunk's request waits on it. base_url can point at a local fake Census endpoint for testing
+    '''
+    chunks = []
+    for start in range(0, len(variables), MAX_VARIABLES_PER_REQUEST):
+        chunk_variables = variables[start:start + MAX_VARIABLES_PER_REQUEST]
+        if limiter is not None:
+            limiter.wait()
+        response = requests.get(base_url + "/" + str(year) + "/acs/acs5",
+                                params={"get": ",".join(chunk_variables),
+                                        "for": "tract:*",
+                                        "in": "state:" + str(state_fips) + " county:*",
+                                        "key": api_key},
+                                timeout=timeout)
+        response.raise_for_status()
+        rows = response.json()
+        chunks.append(pd.DataFrame(rows[1:], columns=rows[0]).set_index(GEOGRAPHY_COLS))
+    state_df = pd.concat(chunks, axis=1).reset_index()
+    ## estimates come back as strings
+    estimate_cols = [col for col in state_df.columns if col.endswith("E") and col != "NAME"]
+    state_df[estimate_cols] = state_df[estimate_cols].apply(pd.to_numeric, errors="coerce")
+    return state_df
+
+
+def _pull_and_cache(fetch_fn, year, state_fips, variables, cache_dir):
+    state_df = fetch_fn(year, state_fips, variables)
+    path = acs_cache_path(cache_dir, year, state_fips, variables)
+    state_df.to_pickle(path + ".tmp")
+    os.replace(path + ".tmp", path)
+    return state_df
+
+
+def pull_acs_tracts(years, fips_list, variables, api_key, cache_dir, max_workers=8,
+                    requests_per_minute=None, max_retries=3, base_url=CENSUS_API_URL,
+                    fetch_fn=None):
+    '''
+    pull tract-level ACS variables for every (year, state) pair, with up to max_workers
+    pulls running at once and at most requests_per_minute Census API requests (each pull
+    sends one request per MAX_VARIABLES_PER_REQUEST variables, and retries send them again;
+    a custom fetch_fn is limited once per pull attempt instead). pairs already in cache_dir are read
+    from disk instead. pairs that still fail after retries are listed and an error is
+    raised once the other pulls are done and cached, so rerunning only requests those.
+    returns a dict of year -> data frame of all states' tracts
+    '''
+    os.makedirs(cache_dir, exist_ok=True)
+    limiter = RateLimiter(requests_per_minute)
+    pull_limiter = limiter
+    if fetch_fn is None:
+        ## the limiter is waited on before each HTTP request, not once per pull
+        fetch_fn = partial(fetch_state_tracts, api_key=api_key, base_url=base_url, limiter=limiter)
+        pull_limiter = RateLimiter(None)
+    pairs = [(year, fip) for year in years for fip in fips_list]
+    by_pair = {}
+    missing = []
+    for year, fip in pairs:
+        path = acs_cache_path(cache_dir, year, fip, variables)
+        if os.path.exists(path):
+            by_pair[(year, fip)] = pd.read_pickle(path)
+        else:
+            missing.append((year, fip))
+    print(str(len(pairs) - len(missing)) + " (year, state) pulls found in cache, " +
+          str(len(missing)) + " to request")
+
+    failed = []
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(call_with_retries,
+                               partial(_pull_and_cache, fetch_fn, year, fip, variables, cache_dir),
+                               pull_limiter, max_retries, 2,
+                               "ACS pull for " + str(year) + " state " + str(fip)): (year, fip)
+                   for year, fip in missing}
+        for future in as_completed(futures):
+            try:
+                by_pair[futures[future]] = future.result()
+            except Exception as e:
+                print("ACS pull for " + str(futures[future]) + " failed: " + repr(e))
+                failed.append(futures[future])
+    if failed:
+        raise RuntimeError("ACS pulls failed for (year, state): " + str(sorted(failed)) +
+                           "; rerun to request just these")
+
+    return {year: pd.concat([by_pair[(year, fip)] for fip in fips_list])
+            for year in years}
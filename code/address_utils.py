@@ -0,0 +1,82 @@
+##################
+# Vectorized address building and normalization
+# (used by 05 and 10a in place of the row-wise create_address_from/handle_null)
+##################
+
+import datetime
+import re
+
+import pandas as pd
+
+## USPS standard street suffix and unit abbreviations (Publication 28, most common ones)
+USPS_SUFFIXES = {"ALLEY": "ALY", "AVENUE": "AVE", "BOULEVARD": "BLVD", "CIRCLE": "CIR",
+                 "COURT": "CT", "CROSSING": "XING", "DRIVE": "DR", "EXPRESSWAY": "EXPY",
+                 "FREEWAY": "FWY", "HIGHWAY": "HWY", "LANE": "LN", "PARKWAY": "PKWY",
+                 "PLACE": "PL", "PLAZA": "PLZ", "ROAD": "RD", "ROUTE": "RTE", "SQUARE": "SQ",
+                 "STREET": "ST", "TERRACE": "TER", "TRAIL": "TRL", "TURNPIKE": "TPKE",
+                 "WAY": "WAY", "APARTMENT": "APT", "BUILDING": "BLDG", "FLOOR": "FL",
+                 "SUITE": "STE", "UNIT": "UNIT", "NORTH": "N", "SOUTH": "S", "EAST": "E",
+                 "WEST": "W", "NORTHEAST": "NE", "NORTHWEST": "NW", "SOUTHEAST": "SE",
+                 "SOUTHWEST": "SW"}
+USPS_PATTERN = re.compile(r"\b(" + "|".join(USPS_SUFFIXES) + r")\b")
+PO_BOX_PATTERN = re.compile(r"\bP\s*O\s*BOX\b|\bPOST OFFICE BOX\b")
+## anything other than letters, digits, spaces, # and - is treated as a separator
+PUNCTUATION_PATTERN = re.compile(r"[^A-Z0-9#\- ]")
+ZIP_PATTERN = re.compile(r"^(\d{3,5})(?:\s*-?\s*\d{4})?$")
+
+
+def clean_part(col):
+    '''
+    vectorized version of handle_null: missing values, negative numbers and dates
+    (which show up in some address columns as excel artifacts) become "", everything
+    else is converted to a stripped string
+    '''
+    col = pd.Series(col).astype("object")
+    is_blank = col.isna()
+    is_blank |= pd.to_numeric(col, errors="coerce") < 0
+    is_blank |= col.map(type).isin([datetime.date, datetime.datetime, pd.Timestamp])
+    return col.where(~is_blank, "").astype(str).str.strip()
+
+
+def normalize_text(col):
+    '''uppercase, swap punctuation for spaces and collapse whitespace'''
+    col = col.str.upper().str.replace(PUNCTUATION_PATTERN, " ", regex=True)
+    return col.str.replace(r"\s+", " ", regex=True).str.strip()
+
+
+def normalize_street(col):
+    '''normalize_text plus USPS abbreviations for street suffixes, units, directions and PO boxes'''
+    col = normalize_text(col).str.replace(PO_BOX_PATTERN, "PO BOX", regex=True)
+    return col.str.replace(USPS_PATTERN, lambda m: USPS_SUFFIXES[m.group(1)], regex=True)
+
+
+def normalize_zip(col):
+    '''5-digit zip: drops the +4, the ".0" from zips read as floats, and restores leading zeros'''
+    col = col.str.replace(r"\.0+$", "", regex=True).str.strip()
+    return col.str.extract(ZIP_PATTERN, expand=False).str.zfill(5).fillna("")
+
+
+def create_full_address(df, address_col, city_col, state_col, zip_col, normalize=True):
+    '''
+    build "ADDRESS, CITY STATE ZIP" for every row with pandas string ops. the ", "
+    after the address is always there (a blank address gives ", CITY STATE ZIP", a
+    blank city/state/zip "ADDRESS, ..."), so EMPLOYER_FULLADDRESS has one layout either way.
+    with normalize=True the parts are canonicalized (case, whitespace, punctuation,
+    USPS suffixes, ZIP+4) so near-identical addresses collapse to the same string, and
+    the spaces left by blank parts are collapsed and stripped (only whitespace, never
+    the comma); normalize=False matches the old create_address_from output, except
+    that missing values, negative numbers and dates are blanked as handle_null meant to
+    '''
+    address = clean_part(df[address_col])
+    city = clean_part(df[city_col])
+    state = clean_part(df[state_col])
+    zip_code = clean_part(df[zip_col])
+    if normalize:
+        address = normalize_street(address)
+        city = normalize_text(city)
+        state = normalize_text(state)
+        zip_code = normalize_zip(zip_code)
+    full_address = address + ", " + city + " " + state + " " + zip_code
+    if normalize:
+        full_address = full_address.str.replace(r"\s+", " ", regex=True).str.strip()
+    return full_address
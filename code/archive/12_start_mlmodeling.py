@@ -40,10 +40,10 @@ H2A_DATA_FILE_PATH2 = "/Users/Firstclass/Dropbox (Dartmouth College)/qss20_final
 
 def get_ordinal(df, col):
     '''function that turns a col into datetime then ordinal timestamp, old input col will be replaced '''
-    df[col] = pd.to_datetime(df[col],errors='coerce')
-    df[col] = np.where(df[col].isna, pd.to_datetime('1/1/1'), df[col])
-    df[col] = [pd.Timestamp(date) for date in df[col]]
-    df[col] = [tstamp.toordinal() for tstamp in df[col]]
+    ## (vectorized version of the old per-Timestamp toordinal; date_features.py has the one 12 uses)
+    dates = pd.to_datetime(df[col],errors='coerce')
+    days = dates.to_numpy(dtype='datetime64[D]').astype(np.int64) + 719163 # 719163 = ordinal of 1970-01-01
+    df[col] = np.where(dates.isna(), 1, days) # missing -> 1/1/1 (ordinal 1)
     return df
 
 def gen_topk_dummies(df, feature, percentThreshold):
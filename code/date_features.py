@@ -0,0 +1,57 @@
+##################
+# Date features for the ML preprocessing (12_mlmodeling_preprocessing.py)
+# turns the job / requested date columns into integer day numbers with
+# datetime64 arithmetic (no per-row Timestamp objects), adds day-count
+# durations between them, and fills missing values with each column's mode
+##################
+
+import numpy as np
+import pandas as pd
+
+DATE_COLS = ['JOB_START_DATE', 'REQUESTED_START_DATE_OF_NEED', 'JOB_END_DATE', 'REQUESTED_END_DATE_OF_NEED']
+## duration feature -> (from date, to date); the duration is to - from in days
+DURATION_FEATURES = {"job_length_days": ("JOB_START_DATE", "JOB_END_DATE"),
+                     "requested_length_days": ("REQUESTED_START_DATE_OF_NEED", "REQUESTED_END_DATE_OF_NEED"),
+                     "start_lead_days": ("REQUESTED_START_DATE_OF_NEED", "JOB_START_DATE")}
+## date.toordinal() of 1970-01-01, so day numbers match what Timestamp.toordinal() gave
+EPOCH_ORDINAL = 719163
+
+
+def day_numbers(col):
+    '''
+    column of dates (strings or datetimes) -> float day numbers (as Timestamp.toordinal() gives),
+    NaN where the date is missing or doesn't parse
+    '''
+    dates = pd.to_datetime(col, errors='coerce')
+    if getattr(dates.dt, "tz", None) is not None:
+        dates = dates.dt.tz_localize(None)
+    days = dates.to_numpy(dtype='datetime64[D]').astype(np.int64).astype(np.float64) + EPOCH_ORDINAL
+    days[dates.isna().to_numpy()] = np.nan
+    return pd.Series(days, index=col.index, name=col.name)
+
+
+def column_mode(col):
+    '''most common non-missing value (the smallest one if tied), NaN if there is none'''
+    modes = col.mode(dropna=True)
+    return modes.iloc[0] if len(modes) > 0 else np.nan
+
+
+def date_features(df, date_cols=DATE_COLS, durations=DURATION_FEATURES, fill_values=None):
+    '''
+    day numbers of date_cols plus the durations between them, in one frame with df's index.
+    durations are taken between the dates as given (before imputation), then every column's
+    missing values are filled with its mode, or with fill_values (column -> value, eg the
+    modes from the training split) when given. columns without missing values left are int64.
+    returns the features and the fill values used
+    '''
+    features = pd.DataFrame({col: day_numbers(df[col]) for col in date_cols}, index=df.index)
+    for name, (from_col, to_col) in durations.items():
+        features[name] = features[to_col] - features[from_col]
+
+    if fill_values is None:
+        fill_values = {col: column_mode(features[col]) for col in features}
+    features = features.fillna(fill_values)
+    for col in features:
+        if not features[col].isna().any():
+            features[col] = features[col].astype(np.int64)
+    return features, fill_values
@@ -0,0 +1,309 @@
+##################
+# Helpers to read the yearly H-2A disclosure workbooks
+# through a parquet cache (used by 01 and 02) and to write/read
+# the combined dataset (used by 02, 05 and 12)
+##################
+
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from os import listdir
+
+import pandas as pd
+
+DISCLOSURE_PATTERN = "H_2A_Disclosure_Data"
+CACHE_MANIFEST = "manifest.json"
+
+
+def disclosure_year(filename):
+    '''pull the fiscal year (eg "2014") out of a disclosure file name'''
+    return re.findall("20[0-9][0-9]", filename)[0]
+
+
+def list_disclosure_files(raw_dir):
+    '''list the disclosure workbooks in the raw directory, sorted by year'''
+    all_disclosure_files = [file for file in listdir(raw_dir) if
+                            DISCLOSURE_PATTERN in file and file.endswith(".xlsx")]
+    return sorted(all_disclosure_files, key=disclosure_year)
+
+
+def file_hash(path, chunk_size=1 << 20):
+    '''sha256 of a file, read in chunks so large workbooks dont sit in memory'''
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def type_for_parquet(df):
+    '''
+    prune and type a frame read from excel so it can be written to parquet:
+    drops the fully blank "Unnamed: x" columns excel leaves behind and
+    casts object columns that mix types (eg zip codes stored as both int and str)
+    to strings, since arrow needs one type per column
+    '''
+    blank_cols = [col for col in df.columns if str(col).startswith("Unnamed:")
+                  and df[col].isna().all()]
+    df = df.drop(columns=blank_cols)
+    for col in df.columns:
+        if df[col].dtype != "object":
+            continue
+        inferred = pd.api.types.infer_dtype(df[col], skipna=True)
+        if inferred in ("date", "datetime"):
+            df[col] = pd.to_datetime(df[col], errors="coerce")
+        elif inferred not in ("string", "empty"):
+            df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+    return df
+
+
+def _read_manifest(cache_dir):
+    manifest_path = os.path.join(cache_dir, CACHE_MANIFEST)
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+def _write_manifest(cache_dir, manifest):
+    manifest_path = os.path.join(cache_dir, CACHE_MANIFEST)
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+
+def _cache_entry_is_current(entry, xlsx_path, cache_dir):
+    '''
+    check a manifest entry against the workbook on disk; size and mtime are checked
+    first so the workbook is only re-hashed when it looks like it changed
+    '''
+    if entry is None or not os.path.exists(os.path.join(cache_dir, entry["parquet"])):
+        return False
+    stat = os.stat(xlsx_path)
+    if entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+        return True
+    return entry["sha256"] == file_hash(xlsx_path)
+
+
+def convert_workbook(xlsx_path, cache_dir):
+    '''parse one workbook and write it to the cache as parquet, returns the manifest entry'''
+    source_hash = file_hash(xlsx_path)
+    stem = os.path.splitext(os.path.basename(xlsx_path))[0]
+    parquet_name = stem + "_" + source_hash[:12] + ".parquet"
+    df = type_for_parquet(pd.read_excel(xlsx_path))
+    df.to_parquet(os.path.join(cache_dir, parquet_name), index=False)
+    stat = os.stat(xlsx_path)
+    return {"source": os.path.basename(xlsx_path),
+            "sha256": source_hash,
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "parquet": parquet_name,
+            "nrows": df.shape[0],
+            "columns": df.columns.tolist()}
+
+
+def _timed_convert(xlsx_path, cache_dir):
+    '''convert_workbook plus the seconds it took, run inside the worker processes'''
+    start = time.time()
+    entry = convert_workbook(xlsx_path, cache_dir)
+    entry["convert_seconds"] = time.time() - start
+    return entry
+
+
+def refresh_cache(raw_dir, cache_dir, n_workers=None):
+    '''
+    make sure every disclosure workbook in raw_dir has a current parquet copy in
+    cache_dir, converting only the years whose xlsx is new or has changed.
+    stale years are parsed in parallel across n_workers processes (defaults to
+    one per stale file, capped at the cpu count; 1 parses them in this process).
+    if some workbooks fail, the years that converted are still added to the manifest
+    before an error listing the failed years is raised.
+    returns the manifest (year -> entry)
+    '''
+    os.makedirs(cache_dir, exist_ok=True)
+    manifest = _read_manifest(cache_dir)
+    stale = {}
+    for file in list_disclosure_files(raw_dir):
+        year = disclosure_year(file)
+        xlsx_path = os.path.join(raw_dir, file)
+        if not _cache_entry_is_current(manifest.get(year), xlsx_path, cache_dir):
+            stale[year] = xlsx_path
+    if not stale:
+        return manifest
+
+    if n_workers is None:
+        n_workers = min(len(stale), os.cpu_count() or 1)
+    print("Converting " + str(len(stale)) + " file(s) to parquet cache with " +
+          str(n_workers) + " worker(s)")
+    start = time.time()
+    new_entries = {}
+    failed = {}
+    if n_workers == 1:
+        for year in stale:
+            try:
+                new_entries[year] = _timed_convert(stale[year], cache_dir)
+            except Exception as e:
+                failed[year] = e
+    else:
+        ## fork where available so the calling script (which has no __main__ guard)
+        ## isnt re-run inside each worker the way the spawn start method would
+        start_methods = multiprocessing.get_all_start_methods()
+        mp_context = multiprocessing.get_context("fork" if "fork" in start_methods else None)
+        with ProcessPoolExecutor(max_workers=n_workers, mp_context=mp_context) as pool:
+            futures = {year: pool.submit(_timed_convert, stale[year], cache_dir) for year in stale}
+            for year, future in futures.items():
+                try:
+                    new_entries[year] = future.result()
+                except Exception as e:
+                    failed[year] = e
+
+    ## record every year that converted, even if others failed, so the next run
+    ## only re-converts the failed ones
+    for year, new_entry in new_entries.items():
+        print("Converted " + new_entry["source"] + " in " +
+              str(round(new_entry["convert_seconds"], 1)) + " sec")
+        ## remove the stale parquet for that year if the source changed
+        entry = manifest.get(year)
+        if entry is not None and entry["parquet"] != new_entry["parquet"]:
+            stale_path = os.path.join(cache_dir, entry["parquet"])
+            if os.path.exists(stale_path):
+                os.remove(stale_path)
+        manifest[year] = new_entry
+    _write_manifest(cache_dir, manifest)
+    print("Conversion wall time (sec): " + str(round(time.time() - start, 1)) +
+          ", sum of per-file times (sec): " +
+          str(round(sum(entry["convert_seconds"] for entry in new_entries.values()), 1)))
+    if failed:
+        for year, e in sorted(failed.items()):
+            print("Converting " + os.path.basename(stale[year]) + " failed: " + repr(e))
+        raise RuntimeError("Converting disclosure files failed for year(s): " + str(sorted(failed)) +
+                           "; the other years are cached, rerun to convert just these") \
+            from next(iter(failed.values()))
+    return manifest
+
+
+def read_disclosure_files(raw_dir, cache_dir, columns=None, n_workers=None):
+    '''
+    read all disclosure years through the parquet cache. returns a dictionary
+    with keys like "df_2014", matching the disc_files dict in 02. columns optionally
+    restricts which columns are read (columns missing from a year are skipped);
+    n_workers is passed to refresh_cache
+    '''
+    manifest = refresh_cache(raw_dir, cache_dir, n_workers=n_workers)
+    disc_files = {}
+    for year in sorted(manifest):
+        entry = manifest[year]
+        if not os.path.exists(os.path.join(raw_dir, entry["source"])):
+            continue
+        year_columns = None
+        if columns is not None:
+            year_columns = [col for col in columns if col in entry["columns"]]
+        start = time.time()
+        disc_files["df_" + year] = pd.read_parquet(os.path.join(cache_dir, entry["parquet"]),
+                                                   columns=year_columns)
+        print("Read cached file: " + entry["parquet"] + " in " +
+              str(round(time.time() - start, 2)) + " sec")
+    return disc_files
+
+
+##################
+# Combined 2014-2021 dataset: one partitioned parquet write,
+# with the common-cols and 2020-2021 versions stored as column projections
+##################
+
+## leading underscore so parquet dataset discovery skips it
+H2A_DATASET_VARIANTS = "_variants.json"
+
+
+def memory_mb(df):
+    '''in-memory size of a frame in MB, counting the python strings inside object columns'''
+    return df.memory_usage(deep=True).sum() / 1024 ** 2
+
+
+def optimize_dtypes(df, max_unique_ratio=0.5, date_pattern="DATE", verbose=True):
+    '''
+    shrink the combined frame, which comes out of excel as mostly object columns:
+    - columns with date_pattern in the name are parsed once to datetime64
+    - string columns where values repeat a lot (states, SOC codes, case status,
+      attorney cities...) become categoricals
+    - integer and float columns are downcast to the smallest type that holds them
+    run type_for_parquet first so mixed-type columns are already strings.
+    prints memory before and after when verbose
+    '''
+    if verbose:
+        memory_before = memory_mb(df)
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            continue
+        if date_pattern in str(col) and not pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = pd.to_datetime(df[col], errors="coerce")
+        elif df[col].dtype == "object" or pd.api.types.is_string_dtype(df[col]):
+            n_nonnull = df[col].notna().sum()
+            if n_nonnull > 0 and df[col].nunique() / n_nonnull <= max_unique_ratio:
+                df[col] = df[col].astype("category")
+        elif pd.api.types.is_integer_dtype(df[col]):
+            df[col] = pd.to_numeric(df[col], downcast="integer")
+        elif pd.api.types.is_float_dtype(df[col]):
+            df[col] = pd.to_numeric(df[col], downcast="float")
+    if verbose:
+        print("Memory before dtype optimization (MB): " + str(round(memory_before, 1)) +
+              ", after (MB): " + str(round(memory_mb(df), 1)))
+    return df
+
+
+def write_h2a_dataset(df, dataset_dir, variants, partition_col="data_source"):
+    '''
+    write the all-columns combined frame once, as a parquet dataset partitioned by
+    partition_col. variants maps a version name to {"columns": [...], "years": [...]}
+    (years optional) and is saved next to the data so read_h2a_dataset can project them.
+    a "preserveallcols" variant with every column is always added
+    '''
+    df = optimize_dtypes(type_for_parquet(df.reset_index(drop=True)), verbose=False)
+    variants = dict(variants, preserveallcols={"columns": df.columns.tolist()})
+    ## write to a temporary directory and swap it in, since writing into an
+    ## existing dataset directory adds files instead of replacing them
+    tmp_dir = dataset_dir.rstrip("/") + "_tmp"
+    if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+    df.to_parquet(tmp_dir, partition_cols=[partition_col], index=False)
+    with open(os.path.join(tmp_dir, H2A_DATASET_VARIANTS), "w") as f:
+        json.dump(variants, f, indent=2)
+    if os.path.exists(dataset_dir):
+        shutil.rmtree(dataset_dir)
+    os.replace(tmp_dir, dataset_dir)
+
+
+def h2a_dataset_variants(dataset_dir):
+    '''the variant -> columns/years lookup written alongside the dataset'''
+    with open(os.path.join(dataset_dir, H2A_DATASET_VARIANTS)) as f:
+        return json.load(f)
+
+
+def h2a_dataset_columns(dataset_dir, variant="preserveallcols"):
+    '''column names of a variant, read from the dataset metadata without loading any rows'''
+    return h2a_dataset_variants(dataset_dir)[variant]["columns"]
+
+
+def read_h2a_dataset(dataset_dir, variant="preserveallcols", columns=None, years=None):
+    '''
+    read one version of the combined data. "preserveallcols" is every column,
+    other variants are the projections given to write_h2a_dataset. columns and years
+    (eg ["file_2020"]) further restrict what is read; both are pushed down to parquet
+    so unneeded columns and year partitions are never loaded
+    '''
+    spec = h2a_dataset_variants(dataset_dir)[variant]
+    if columns is None:
+        columns = spec.get("columns")
+    if years is None:
+        years = spec.get("years")
+    filters = [("data_source", "in", list(years))] if years is not None else None
+    df = pd.read_parquet(dataset_dir, columns=columns, filters=filters)
+    if "data_source" in df.columns:
+        df["data_source"] = df["data_source"].astype(str).astype("category")
+    return df
@@ -0,0 +1,136 @@
+##################
+# Registry of year -> canonical column names for the H-2A disclosure files
+# and the code that reconciles and rowbinds the years (used by 02)
+##################
+
+import pandas as pd
+
+## renames that apply to every year
+## rename CASE_NO to CASE_NUMBER & PRIMARY/SUB and PRMARY/SUB to PRIMARY_SUB & NAIC_CODE to NAICS_CODE &
+## AGENT_ATTORNEY_NAME/CITY/STATE to ATTORNEY_AGENT_NAME/CITY/STATE
+COMMON_RENAMES = {"CASE_NO": "CASE_NUMBER",
+                  "PRIMARY/SUB": "PRIMARY_SUB",
+                  "PRMARY/SUB": "PRIMARY_SUB",
+                  "NAIC_CODE": "NAICS_CODE",
+                  "AGENT_ATTORNEY_CITY": "ATTORNEY_AGENT_CITY",
+                  "AGENT_ATTORNEY_STATE": "ATTORNEY_AGENT_STATE",
+                  "AGENT_ATTORNEY_NAME": "ATTORNEY_AGENT_NAME"}
+
+## from 2020 on the job dates, employer address and attorney name use new column names
+RENAMES_2020_ON = {"EMPLOYER_ADDRESS_1": "EMPLOYER_ADDRESS1",
+                   "REQUESTED_BEGIN_DATE": "REQUESTED_START_DATE_OF_NEED",
+                   "REQUESTED_END_DATE": "REQUESTED_END_DATE_OF_NEED",
+                   "EMPLOYMENT_BEGIN_DATE": "JOB_START_DATE",
+                   "EMPLOYMENT_END_DATE": "JOB_END_DATE"}
+
+## attorney first, middle and last name are combined into one name (to match 2014-2019)
+ATTORNEY_NAME_PARTS = ["ATTORNEY_AGENT_FIRST_NAME", "ATTORNEY_AGENT_MIDDLE_NAME",
+                       "ATTORNEY_AGENT_LAST_NAME"]
+
+## one entry per disclosure year. adding a new year (eg FY2022) means adding an entry here
+## - rename: source column -> canonical column, applied after COMMON_RENAMES
+## - composite: canonical column -> list of columns joined with a space
+## - blank: canonical columns that dont exist that year and are added as NaN
+SCHEMA_REGISTRY = {
+    ## (note: WORKSITE_COUNTY info starts being include from 2017 onwards)
+    "2014": {"rename": {"WORKSITE_LOCATION_CITY": "WORKSITE_CITY",
+                        "WORKSITE_LOCATION_STATE": "WORKSITE_STATE",
+                        "SOC_CODE_ID": "SOC_CODE",
+                        "CERTIFICATION_BEGIN_DATE": "JOB_START_DATE",
+                        "CERTIFICATION_END_DATE": "JOB_END_DATE"}},
+    "2015": {"blank": ["REQUESTED_START_DATE_OF_NEED", "REQUESTED_END_DATE_OF_NEED"]},
+    "2016": {},
+    "2017": {},
+    ## (note: this specific column doesnt seem to occur from 2020 onwards)
+    "2018": {"rename": {"FULL_TIME": "FULL_TIME_POSITION"}},
+    "2019": {"rename": {"EMPLOYER_REP_BY_AGENT": "AGENT_POC_EMPLOYER_REP_BY_AGENT"}},
+    "2020": {"rename": RENAMES_2020_ON,
+             "composite": {"ATTORNEY_AGENT_NAME": ATTORNEY_NAME_PARTS}},
+    ## 2021 renames some columns to match 2020
+    "2021": {"rename": dict(RENAMES_2020_ON,
+                            MEALS_CHARGE="MEALS_CHARGED",
+                            HOURLY_SCHEDULE_BEGIN="HOURLY_WORK_SCHEDULE_START",
+                            HOURLY_SCHEDULE_END="HOURLY_WORK_SCHEDULE_END",
+                            TOTAL_WORKSITES_RECORDS="TOTAL_WORKSITE_RECORDS"),
+             "composite": {"ATTORNEY_AGENT_NAME": ATTORNEY_NAME_PARTS}}
+}
+
+
+def year_schema(year):
+    '''return the registry entry for a year with the common renames folded in'''
+    if year not in SCHEMA_REGISTRY:
+        print("No schema registry entry for " + year + ", only applying common renames")
+    entry = SCHEMA_REGISTRY.get(year, {})
+    rename = dict(COMMON_RENAMES)
+    rename.update(entry.get("rename", {}))
+    return {"rename": rename,
+            "composite": entry.get("composite", {}),
+            "blank": entry.get("blank", [])}
+
+
+def canonical_columns(source_columns, year):
+    '''list of canonical column names a year will have after reconciling, without touching the data'''
+    schema = year_schema(year)
+    canonical = [schema["rename"].get(col, col) for col in source_columns]
+    for col in list(schema["composite"]) + schema["blank"] + ["data_source"]:
+        if col not in canonical:
+            canonical.append(col)
+    return canonical
+
+
+def reconcile_year(df, year, columns=None):
+    '''
+    rename one year's frame to the canonical columns, building composite fields
+    with vectorized string ops. if columns is given, only those canonical columns
+    are built (in that order) and ones the year doesnt have are left as NaN
+    '''
+    schema = year_schema(year)
+    source_for = {}
+    for col in df.columns:
+        source_for.setdefault(schema["rename"].get(col, col), col)
+    wanted = columns if columns is not None else canonical_columns(df.columns, year)
+
+    reconciled = {}
+    for col in wanted:
+        if col in schema["composite"]:
+            parts = [df[part].astype("object").fillna("").astype(str)
+                     for part in schema["composite"][col] if part in df.columns]
+            reconciled[col] = parts[0].str.cat(parts[1:], sep=" ") if parts else pd.Series(
+                None, index=df.index, dtype="object")
+        elif col == "data_source":
+            reconciled[col] = pd.Series("file_" + year, index=df.index)
+        elif col in source_for:
+            reconciled[col] = df[source_for[col]]
+        else:
+            reconciled[col] = pd.Series(None, index=df.index, dtype="object")
+    return pd.DataFrame(reconciled, index=df.index)
+
+
+def intersecting_columns(disc_files, years=None):
+    '''canonical columns present in every year (ordered as in the first year)'''
+    years = years if years is not None else sorted(key.replace("df_", "") for key in disc_files)
+    per_year = [canonical_columns(disc_files["df_" + year].columns, year) for year in years]
+    shared = set.intersection(*[set(cols) for cols in per_year])
+    return [col for col in per_year[0] if col in shared]
+
+
+def union_columns(disc_files, years=None):
+    '''canonical columns present in any year (ordered by first appearance)'''
+    years = years if years is not None else sorted(key.replace("df_", "") for key in disc_files)
+    seen = {}
+    for year in years:
+        for col in canonical_columns(disc_files["df_" + year].columns, year):
+            seen.setdefault(col, None)
+    return list(seen)
+
+
+def combine_disclosure_years(disc_files, columns=None, years=None):
+    '''
+    reconcile each year and rowbind them in a single concat. columns defaults
+    to the union of canonical columns across the years (the preserve-all-cols version);
+    pass intersecting_columns(...) for the common-columns version
+    '''
+    years = years if years is not None else sorted(key.replace("df_", "") for key in disc_files)
+    columns = columns if columns is not None else union_columns(disc_files, years)
+    return pd.concat([reconcile_year(disc_files["df_" + year], year, columns)
+                      for year in years])
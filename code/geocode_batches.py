@@ -0,0 +1,102 @@
+##################
+# Concurrent batched geocoding (used by 05): keeps several batches
+# in flight under a rate limit, retries failed batches with backoff
+# and checkpoints finished batches so a crashed run can resume
+##################
+
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+
+import requests
+
+from geocode_cache import GEOCODE_FIELDS
+from http_utils import RateLimiter, call_with_retries
+
+GEOCODIO_BASE_URL = "https://api.geocod.io/v1.7"
+
+
+def parse_geocoding_result(result):
+    '''pull lat/long/accuracy out of one Geocodio result (all None if it failed)'''
+    try:
+        results = result['results'][0]
+        return {"geo_lat": results['location']['lat'],
+                "geo_long": results['location']['lng'],
+                "geo_accuracy": results['accuracy'],
+                "geo_accuracy_type": results['accuracy_type']}
+    except:
+        return {field: None for field in GEOCODE_FIELDS}
+
+
+def http_geocoder(api_key, base_url=GEOCODIO_BASE_URL, timeout=600):
+    '''
+    batch geocoding function that posts straight to the Geocodio batch endpoint.
+    base_url can point at a local stand-in server for testing; it needs to accept
+    POST {base_url}/geocode with a json list of addresses and answer like Geocodio:
+    {"results": [{"query": ..., "response": {"results": [...]}}, ...]}
+    '''
+    def geocode(addresses):
+        response = requests.post(base_url + "/geocode", params={"api_key": api_key},
+                                 json=list(addresses), timeout=timeout)
+        response.raise_for_status()
+        return [item["response"] for item in response.json()["results"]]
+    return geocode
+
+
+def _batch_checkpoint_path(checkpoint_dir, batch):
+    batch_hash = hashlib.sha256("\n".join(batch).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(checkpoint_dir, "batch_" + batch_hash + ".json")
+
+
+def _geocode_batch(geocode_fn, batch):
+    results = geocode_fn(batch)
+    assert len(results) == len(batch)
+    return results
+
+
+def geocode_batches(batches, geocode_fn, max_workers=4, requests_per_minute=None,
+                    max_retries=5, backoff_base=2, checkpoint_dir=None, on_batch_done=None):
+    '''
+    geocode a list of address batches with up to max_workers batches in flight.
+    geocode_fn takes a list of addresses and returns one Geocodio result per address
+    (eg client.geocode or http_geocoder(...)). failed batches are retried with
+    exponential backoff. each finished batch is parsed with parse_geocoding_result and
+    - if checkpoint_dir is set, written there so a rerun skips it
+    - if on_batch_done is set, passed to it as a dict of address -> result
+      (called from this thread, so it's safe to write to eg a sqlite cache)
+    returns a dict of address -> parsed result for every address
+    '''
+    if checkpoint_dir is not None:
+        os.makedirs(checkpoint_dir, exist_ok=True)
+    batches = [batch for batch in batches if len(batch) > 0]
+    all_results = {}
+    pending = []
+    for batch in batches:
+        if checkpoint_dir is not None and os.path.exists(_batch_checkpoint_path(checkpoint_dir, batch)):
+            with open(_batch_checkpoint_path(checkpoint_dir, batch)) as f:
+                all_results.update(json.load(f))
+        else:
+            pending.append(batch)
+    print("Geocoding " + str(len(pending)) + " batch(es), " +
+          str(len(batches) - len(pending)) + " already checkpointed")
+
+    limiter = RateLimiter(requests_per_minute)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(call_with_retries, partial(_geocode_batch, geocode_fn, batch),
+                               limiter, max_retries, backoff_base,
+                               "Batch of " + str(len(batch))): batch for batch in pending}
+        for future in as_completed(futures):
+            batch = futures[future]
+            batch_results = {addr: parse_geocoding_result(result)
+                             for addr, result in zip(batch, future.result())}
+            if checkpoint_dir is not None:
+                checkpoint_path = _batch_checkpoint_path(checkpoint_dir, batch)
+                with open(checkpoint_path + ".tmp", "w") as f:
+                    json.dump(batch_results, f)
+                os.replace(checkpoint_path + ".tmp", checkpoint_path)
+            if on_batch_done is not None:
+                on_batch_done(batch_results)
+            all_results.update(batch_results)
+    return all_results
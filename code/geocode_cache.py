@@ -0,0 +1,113 @@
+##################
+# Persistent sqlite cache of geocoding results (used by 05)
+# so reruns only send new addresses to Geocodio
+##################
+
+import sqlite3
+import time
+
+GEOCODE_FIELDS = ["geo_lat", "geo_long", "geo_accuracy", "geo_accuracy_type"]
+
+
+def normalize_cache_key(address):
+    '''cache key for an address: uppercase with runs of whitespace collapsed'''
+    return " ".join(str(address).upper().split())
+
+
+class GeocodeCache:
+    '''
+    sqlite table of normalized address -> geocoding result. entries older than
+    ttl_days are treated as misses and evicted; addresses that got no result (null
+    coordinates) expire after the much shorter negative_ttl_days, so fixed-up or newly
+    geocodable addresses are retried soon. if max_entries is set the least
+    recently used entries beyond that are evicted too. lookups are done for a whole
+    batch of addresses at once by joining against a temp table of keys
+    '''
+
+    def __init__(self, db_path, ttl_days=365, negative_ttl_days=14, max_entries=None):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_days * 24 * 60 * 60
+        self.negative_ttl_seconds = negative_ttl_days * 24 * 60 * 60
+        self.max_entries = max_entries
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.con = sqlite3.connect(db_path)
+        self.con.execute("""CREATE TABLE IF NOT EXISTS geocoded (
+                                address TEXT PRIMARY KEY,
+                                geo_lat REAL,
+                                geo_long REAL,
+                                geo_accuracy REAL,
+                                geo_accuracy_type TEXT,
+                                geocoded_at REAL,
+                                last_used REAL)""")
+        self.con.execute("CREATE INDEX IF NOT EXISTS geocoded_last_used ON geocoded (last_used)")
+        self.con.commit()
+        self.evict()
+
+    def evict(self):
+        '''delete expired entries and, if max_entries is set, the least recently used overflow'''
+        now = time.time()
+        with self.con:
+            self.con.execute("DELETE FROM geocoded WHERE geocoded_at < " + self._expiry_sql(),
+                             (now - self.negative_ttl_seconds, now - self.ttl_seconds))
+            if self.max_entries is not None:
+                self.con.execute("""DELETE FROM geocoded WHERE address IN (
+                                        SELECT address FROM geocoded
+                                        ORDER BY last_used DESC LIMIT -1 OFFSET ?)""",
+                                 (self.max_entries,))
+
+    @staticmethod
+    def _expiry_sql():
+        '''cutoff time of an entry: the negative one for no-result entries, the normal one otherwise'''
+        return "(CASE WHEN geo_lat IS NULL THEN ? ELSE ? END)"
+
+    def lookup(self, addresses):
+        '''
+        look up a batch of addresses in one query. returns a dict of
+        address -> {geo_lat, geo_long, geo_accuracy, geo_accuracy_type} for the hits
+        (including unexpired no-result entries, with null fields)
+        '''
+        keys = {}
+        for address in addresses:
+            keys.setdefault(normalize_cache_key(address), []).append(address)
+        now = time.time()
+        with self.con:
+            self.con.execute("CREATE TEMP TABLE IF NOT EXISTS lookup_keys (address TEXT PRIMARY KEY)")
+            self.con.execute("DELETE FROM lookup_keys")
+            self.con.executemany("INSERT INTO lookup_keys VALUES (?)", [(key,) for key in keys])
+            rows = self.con.execute("""SELECT g.address, g.geo_lat, g.geo_long,
+                                              g.geo_accuracy, g.geo_accuracy_type
+                                       FROM geocoded g JOIN lookup_keys k ON g.address = k.address
+                                       WHERE g.geocoded_at >= """ + self._expiry_sql(),
+                                    (now - self.negative_ttl_seconds, now - self.ttl_seconds)).fetchall()
+            self.con.execute("""UPDATE geocoded SET last_used = ?
+                                WHERE address IN (SELECT address FROM lookup_keys)""", (now,))
+        found = {address: dict(zip(GEOCODE_FIELDS, row[1:]))
+                 for row in rows for address in keys[row[0]]}
+        negative = sum(row[1] is None for row in rows)
+        self.hits += len(rows) - negative
+        self.negative_hits += negative
+        self.misses += len(keys) - len(rows)
+        return found
+
+    def store(self, results):
+        '''
+        save a dict of address -> geocoding result fields (failed geocodes are stored as
+        nulls, which expire after negative_ttl_days)
+        '''
+        now = time.time()
+        with self.con:
+            self.con.executemany("INSERT OR REPLACE INTO geocoded VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                 [(normalize_cache_key(address),) +
+                                  tuple(result.get(field) for field in GEOCODE_FIELDS) + (now, now)
+                                  for address, result in results.items()])
+        if self.max_entries is not None:
+            self.evict()
+
+    def report(self):
+        print("Geocode cache hits: " + str(self.hits) + ", cached no-result entries: " +
+              str(self.negative_hits) + ", misses: " + str(self.misses))
+
+    def close(self):
+        self.con.close()
@@ -0,0 +1,43 @@
+##################
+# Rate limiting and retries shared by the API pull engines
+# (geocode_batches.py and acs_pull.py)
+##################
+
+import random
+import threading
+import time
+
+
+class RateLimiter:
+    '''spaces out calls so at most requests_per_minute start in any minute (thread-safe)'''
+
+    def __init__(self, requests_per_minute=None):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute else 0
+        self.next_start = 0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_start)
+            self.next_start = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+def call_with_retries(fn, limiter, max_retries=5, backoff_base=2, label="Request"):
+    '''
+    call fn() after waiting on the rate limiter, retrying failures with exponential
+    backoff plus jitter; the last failure is re-raised
+    '''
+    for attempt in range(max_retries + 1):
+        limiter.wait()
+        try:
+            return fn()
+        except Exception as e:
+            if attempt == max_retries:
+                raise
+            delay = backoff_base ** attempt + random.uniform(0, 1)
+            print(label + " failed (" + repr(e) + "), retrying in " +
+                  str(round(delay, 1)) + " sec")
+            time.sleep(delay)
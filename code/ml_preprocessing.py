@@ -0,0 +1,187 @@
+##################
+# Fitted feature preprocessing for the ML models (12 fits it, 14/16/17 read its output)
+# everything learned from the data (date fill values, kept top-k levels,
+# numeric means, dummy categories) is learned on the training split only and
+# saved as json, so the test split and new disclosure rows are transformed into
+# exactly the same columns without re-preprocessing the training data.
+# features are a scipy CSR matrix (most columns are mostly-zero dummies), with
+# the column names in the preprocessor's feature_names
+##################
+
+import json
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from date_features import DATE_COLS, date_features
+
+## high-cardinality columns whose rare levels are collapsed into OTHER
+TOPK_COLS = ['ATTORNEY_AGENT_CITY', 'JOB_TITLE', 'ATTORNEY_AGENT_NAME', 'WORKSITE_CITY', 'EMPLOYER_CITY']
+## columns carried along with the features but never used as features
+ID_COLS = ['jobs_group_id', 'jobs_row_id']
+NUMERIC_DTYPES = ["int64", "float64"]
+
+
+class TopKCollapser:
+    '''
+    collapses the rare levels of high-cardinality columns into OTHER, with missing values
+    counted as the level "missing". fit remembers each column's kept levels (those seen at
+    least threshold * the number of job groups times); transform turns each column, in the
+    frame it's given, into a pd.Categorical of the kept levels + OTHER built from category
+    codes, so there's no string replacement and no copy of the frame
+    '''
+
+    def __init__(self, cols, threshold=0.01, group_col="jobs_group_id", levels=None):
+        self.cols = list(cols)
+        self.threshold = threshold
+        self.group_col = group_col
+        self.levels = levels
+
+    def fit(self, df):
+        min_count = int(df[self.group_col].nunique() * self.threshold)
+        self.levels = {}
+        for col in self.cols:
+            ## counts from the factorized codes (code -1, missing, goes first as "missing")
+            codes, uniques = pd.factorize(df[col])
+            counts = pd.Series(np.bincount(codes + 1, minlength=len(uniques) + 1),
+                               index=["missing"] + [str(level) for level in uniques])
+            counts = counts.groupby(level=0, sort=False).sum()
+            self.levels[col] = counts.index[counts >= min_count].tolist()
+            print(f"{col}'s val count was " + str((counts > 0).sum()) + ", levels kept: " +
+                  str(len(self.levels[col])))
+        return self
+
+    def categories(self, col):
+        return self.levels[col] + ([] if "OTHER" in self.levels[col] else ["OTHER"])
+
+    def transform(self, df):
+        '''collapses the columns of df in place (and returns it)'''
+        for col in self.cols:
+            categories = self.categories(col)
+            other_code = categories.index("OTHER")
+            missing_code = categories.index("missing") if "missing" in categories else other_code
+            missing = df[col].isna().to_numpy()
+            codes = pd.Categorical(df[col], categories=categories).codes.astype(np.int64)
+            codes[codes < 0] = other_code
+            codes[missing] = missing_code
+            df[col] = pd.Categorical.from_codes(codes, categories=categories)
+        return df
+
+
+class FeaturePreprocessor:
+    '''
+    fit on the training rows, then transform any rows (training, test, a new quarter)
+    into the same fixed-width CSR feature matrix:
+    - date columns -> day numbers and durations, missing filled with the training modes
+    - top-k columns: missing -> "missing", levels seen for fewer than topk_threshold of the
+      training job groups -> "OTHER"
+    - other non-numeric columns: missing -> "missing_value"
+    - numeric columns: missing filled with the training means
+    - categorical columns -> one dummy per training level (unseen levels get all zeros)
+    '''
+
+    def __init__(self, date_cols=DATE_COLS, topk_cols=TOPK_COLS, topk_threshold=0.01,
+                 group_col="jobs_group_id", id_cols=ID_COLS):
+        self.date_cols = list(date_cols)
+        self.topk_cols = list(topk_cols)
+        self.topk_threshold = topk_threshold
+        self.group_col = group_col
+        self.id_cols = list(id_cols)
+        self.topk = TopKCollapser(self.topk_cols, topk_threshold, group_col)
+        self.fitted = {}
+
+    def _impute(self, df):
+        for col in self.fitted["cat_cols"]:
+            ## (the collapsed top-k columns are categoricals without missing values already)
+            if not isinstance(df[col].dtype, pd.CategoricalDtype):
+                df[col] = df[col].where(df[col].notna(), "missing_value").astype(str)
+        for col in self.fitted["num_cols"]:
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+        df[self.fitted["num_cols"]] = df[self.fitted["num_cols"]].fillna(self.fitted["num_means"])
+        return df
+
+    def _dates(self, df, fill_values=None):
+        dates, fill_values = date_features(df, self.date_cols, fill_values=fill_values)
+        return df.drop(columns=self.date_cols).join(dates), fill_values
+
+    def fit(self, df):
+        '''learn everything the transform needs from the training rows'''
+        df, date_fill_values = self._dates(df)
+        self.fitted = {"date_fill_values": date_fill_values}
+
+        self.fitted["topk_levels"] = self.topk.fit(df).levels
+        df = self.topk.transform(df)
+
+        features = [col for col in df.columns if col not in self.id_cols]
+        self.fitted["num_cols"] = [col for col in features if df.dtypes[col] in NUMERIC_DTYPES]
+        self.fitted["cat_cols"] = [col for col in features if df.dtypes[col] not in NUMERIC_DTYPES]
+        self.fitted["num_means"] = {col: float(df[col].mean()) for col in self.fitted["num_cols"]}
+        df = self._impute(df)
+        self.fitted["categories"] = {col: sorted(df[col].unique().tolist()) for col in self.fitted["cat_cols"]}
+        return self
+
+    @property
+    def feature_names(self):
+        return self.fitted["num_cols"] + [col + "_" + level for col in self.fitted["cat_cols"]
+                                          for level in self.fitted["categories"][col]]
+
+    def transform(self, df):
+        '''
+        CSR feature matrix (columns in feature_names order) for any rows with the raw feature
+        columns, built in one pass: the nonzero numeric values and one 1 per categorical column
+        (at that column's offset + the level's code) are collected as (row, column, value)
+        triplets and turned into the matrix once, no dense dummy frames are built
+        '''
+        df, _ = self._dates(df, self.fitted["date_fill_values"])
+        df = self._impute(self.topk.transform(df))
+
+        num_values = df[self.fitted["num_cols"]].to_numpy(dtype=np.float64)
+        rows, cols = np.nonzero(num_values)
+        rows, cols, values = [rows], [cols], [num_values[rows, cols]]
+        offset = len(self.fitted["num_cols"])
+        for col in self.fitted["cat_cols"]:
+            codes = pd.Categorical(df[col], categories=self.fitted["categories"][col]).codes
+            seen = codes >= 0
+            rows.append(np.flatnonzero(seen))
+            cols.append(offset + codes[seen].astype(np.int64))
+            values.append(np.ones(seen.sum()))
+            offset += len(self.fitted["categories"][col])
+
+        return sparse.csr_matrix((np.concatenate(values), (np.concatenate(rows), np.concatenate(cols))),
+                                 shape=(len(df), offset))
+
+    def fit_transform(self, df):
+        return self.fit(df).transform(df)
+
+    def save(self, path):
+        '''json with the settings and everything fitted'''
+        with open(path, "w") as f:
+            json.dump({"date_cols": self.date_cols, "topk_cols": self.topk_cols,
+                       "topk_threshold": self.topk_threshold, "group_col": self.group_col,
+                       "id_cols": self.id_cols, "fitted": self.fitted}, f, indent=2)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            saved = json.load(f)
+        preprocessor = cls(saved["date_cols"], saved["topk_cols"], saved["topk_threshold"],
+                           saved["group_col"], saved["id_cols"])
+        preprocessor.fitted = saved["fitted"]
+        preprocessor.topk.levels = saved["fitted"]["topk_levels"]
+        return preprocessor
+
+
+def save_split(path, features, rows):
+    '''
+    one split as path + "_features.npz" (the CSR features) and path + ".pkl" (the id and
+    outcome columns, plus feature_row: the row of the features, which stays with each row
+    through subsetting and resampling)
+    '''
+    sparse.save_npz(path + "_features.npz", features)
+    rows.reset_index(drop=True).assign(feature_row=np.arange(rows.shape[0])).to_pickle(path + ".pkl")
+
+
+def load_split(path):
+    '''CSR features and id/outcome rows saved by save_split'''
+    return sparse.load_npz(path + "_features.npz"), pd.read_pickle(path + ".pkl")
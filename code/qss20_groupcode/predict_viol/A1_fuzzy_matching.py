@@ -10,6 +10,12 @@ import random
 import re
 import recordlinkage
 import time
+import argparse
+from linkage_engine import link_blocks, link_pairs, assemble_matches
+import candidate_index
+from name_cleaning import NameCleaner
+from incremental_linkage import link_incremental
+import os
 
 # -------- USER DEFINED FUNCTIONS --------
 
@@ -22,86 +28,101 @@ def find_status(one):
     return found[0]
 
 
-# this function will clean the EMPLOYER_NAME in approved_only (h2a apps) and legal_name in violations (WHD data)
-def clean_names(one):
-    string_version = str(one)               # convert to string
-    upper_only = string_version.upper()     # convert to uppercase
-    pattern = r"(LLC|CO|INC)\."             # locate the LLC, CO, or INC that are followed by a period
-    replacement = r'\1'                     # replace the whole pattern with the LLC/CO/INC component
-    res = re.sub(pattern, replacement, upper_only)  # compute and return the result
-    return res
+# the EMPLOYER_NAME in approved_only (h2a apps) and legal_name in violations (WHD data) are
+# cleaned with NameCleaner in name_cleaning.py (LLC./CO./INC. -> LLC/CO/INC)
 
 
 # Function to do the fuzzy matching
+# candidate pairs within each block are scored across n_workers processes,
+# chunk_size pairs at a time (see link_blocks in linkage_engine.py).
+# indexer optionally replaces the exhaustive block with a function of (dbase1, dbase2)
+# returning candidate pairs as positions (see INDEXERS below and candidate_index.py).
+# with state_dir set, the match runs incrementally: records are identified by keyLeft/keyRight,
+# and only pairs involving records that are new or changed since the run saved in
+# state_dir are scored (see incremental_linkage.py). that needs an indexer that decides each
+# pair from its own two records (not sorted_neighbourhood, see INCREMENTAL_INDEXERS)
 def fuzzy_match(dbase1, dbase2, blockLeft, blockRight, matchVar1, matchVar2, distFunction,
-               threshold, colsLeft, colsRight):
+               threshold, colsLeft, colsRight, n_workers=None, chunk_size=500000, indexer=None,
+               state_dir=None, keyLeft=None, keyRight=None):
     print('*** Starting Fuzzy Matching ***')
-    link_jobs_debar = recordlinkage.Index()  # initialize our Index
-    link_jobs_debar.block(left_on=blockLeft, right_on=blockRight)         # block on the given block variable
-
-    # form our index with the two given databases
-    candidate_links = link_jobs_debar.index(dbase1, dbase2)
-
-    compare = recordlinkage.Compare()       # initialize our compare class
     if len(matchVar1) != len(matchVar2):  # ensure matching num. of matching vars
         print("Need to pass in your matching variables in an array and you need to have "
               "the same number of matching variables. Please try again. ")
         return
 
-    for i in range(len(matchVar1)):         # for each matching pair, add to our comparator
-        compare.string(matchVar1[i], matchVar2[i], method=distFunction, threshold=threshold)
-
-    compare_vectors = compare.compute(candidate_links, dbase1, dbase2)  # compute
-    # compare_vectors
-
-    # rename columns
-    temp_array = []
-    for i in range(len(matchVar1)):
-        colName = str(matchVar1[i])
-        temp_array.append(colName)
-    compare_vectors.columns = temp_array
-
-    # Find the correct selection
-    conditions = []
-    for one in matchVar1:
-        condition_string = "({one_input} == 1)".format(one_input = one)
-        conditions.append(condition_string)
-    if len(conditions) > 1:
-        comparison = "&".join(conditions)
+    # block (or index), compare and keep the pairs that pass on every matching variable
+    def link(d1, d2):
+        if indexer is None:
+            compare_vectors, block_stats = link_blocks(d1, d2, blockLeft, blockRight, matchVar1, matchVar2,
+                                                       distFunction, threshold, n_workers=n_workers,
+                                                       chunk_size=chunk_size)
+        else:
+            left_pos, right_pos = indexer(d1, d2)
+            compare_vectors, block_stats = link_pairs(d1, d2, left_pos, right_pos, blockLeft, matchVar1,
+                                                      matchVar2, distFunction, threshold, n_workers=n_workers,
+                                                      chunk_size=chunk_size)
+        return compare_vectors
+
+    if state_dir is None:
+        compare_vectors = link(dbase1, dbase2)
     else:
-        comparison = conditions[0]
-    selected = compare_vectors.query(comparison).copy()
-
-    # Extract index from selection
-    n = selected.shape[0]
-    index_dbase1_values = []
-    index_dbase2_values = []
-    for i in range(n):
-        index = selected.index[i]
-        index_dbase1_values.append(index[0])
-        index_dbase2_values.append(index[1])
-    selected["index_dbase1"] = index_dbase1_values.copy()
-    selected["index_dbase2"] = index_dbase2_values.copy()
-
-    # merge jobs with original columns
-    # this will throw an error if jobs is not the left
-    dbase1["index_dbase1"] = dbase1.index
-    dbase1_columns = colsLeft
-    m1 = pd.merge(selected, dbase1[dbase1_columns], on="index_dbase1", how="inner")
-
-    # merge debar with original columns
-    dbase2["index_dbase2"] = dbase2.index
-    dbase2_columns = colsRight
-    m2 = pd.merge(m1, dbase2[dbase2_columns], on="index_dbase2", how="inner", suffixes=["_left", "_right"])
+        config = {"blockLeft": blockLeft, "blockRight": blockRight, "matchVar1": list(matchVar1),
+                  "matchVar2": list(matchVar2), "distFunction": distFunction, "threshold": threshold}
+        compare_vectors = link_incremental(dbase1, dbase2, keyLeft, keyRight, [blockLeft] + list(matchVar1),
+                                           [blockRight] + list(matchVar2), state_dir, config, link)
+
+    # keep the pairs that matched on every variable and gather the requested columns
+    # from each database by position (dbase1 and dbase2 are left unchanged)
+    m2 = assemble_matches(compare_vectors, dbase1, dbase2, colsLeft, colsRight)
 
     print('**** DONE WITH FUZZY MATCHING ****')
     return m2
 
 
 # -------- DRIVER CODE --------
-# load in h2a data
-h2a = pd.read_excel("../data/h2a_2018.xlsx")
-print('*** H2A Loaded ***')
+my_parser = argparse.ArgumentParser(description='Fuzzy match H2A applications to WHD investigations')
+my_parser.add_argument('--years', type = int, nargs = '+', default = [2018],
+                       help = "disclosure year(s) to match, eg 2014 2015 ... 2021")
+my_parser.add_argument('--h2a_dataset', default = None,
+                       help = "path to the combined 2014-2021 parquet dataset written by 02_RenameCol_Rowbind.py; "
+                              "if not given, ../data/h2a_YEAR.xlsx is read for each year")
+my_parser.add_argument('--workers', type = int, default = None, help = "number of processes scoring pairs")
+my_parser.add_argument('--chunk_size', type = int, default = 500000, help = "candidate pairs scored at a time")
+my_parser.add_argument('--indexer', default = "state_block",
+                       choices = ["state_block", "state_city", "sorted_neighbourhood", "minhash_lsh"],
+                       help = "how candidate pairs are generated")
+my_parser.add_argument('--lsh_bands', type = int, default = 16,
+                       help = "MinHash LSH bands for --indexer minhash_lsh (more bands: more pairs, higher recall)")
+my_parser.add_argument('--lsh_rows', type = int, default = 4,
+                       help = "MinHash rows per LSH band (more rows: fewer pairs); names with q-gram Jaccard "
+                              "above about (1 / bands) ** (1 / rows) are likely candidates")
+my_parser.add_argument('--name_memo_dir', default = "../output/name_clean_memo/",
+                       help = "where raw -> clean employer names are kept between runs")
+my_parser.add_argument('--incremental_state_dir', default = None,
+                       help = "match incrementally against the run saved here (eg ../output/linkage_state/); "
+                              "only new or changed applications/investigations are scored")
+my_parser.add_argument('--evaluate_indexers', action = "store_true",
+                       help = "also report each indexer's pair reduction and recall against the state block")
+args = my_parser.parse_args()
+
+# indexers that decide each candidate pair from its own two records, so an incremental run gives
+# the same matches as a full one. sorted_neighbourhood's windows depend on every name in the
+# state, so new records shift which old pairs are candidates and it has to rematch everything
+INCREMENTAL_INDEXERS = ["state_block", "state_city", "minhash_lsh"]
+if args.incremental_state_dir is not None and args.indexer not in INCREMENTAL_INDEXERS:
+    my_parser.error("--incremental_state_dir can't be used with --indexer %s (its candidate pairs depend on "
+                    "the other records, so an incremental run wouldn't match a full one); use one of %s"
+                    % (args.indexer, ", ".join(INCREMENTAL_INDEXERS)))
+
+# load in h2a data (one or more years, stacked)
+if args.h2a_dataset is not None:
+    h2a = pd.read_parquet(args.h2a_dataset, filters=[("data_source", "in", ["file_" + str(year) for year in args.years])])
+    h2a["data_source"] = h2a["data_source"].astype(str)
+else:
+    h2a = pd.concat([pd.read_excel("../data/h2a_" + str(year) + ".xlsx").assign(data_source="file_" + str(year))
+                     for year in args.years], ignore_index=True)
+h2a = h2a.reset_index(drop=True)
+print('*** H2A Loaded: %s applications from %s ***' % (len(h2a), args.years))
 
 # load in investigations/violations data
 # url = "../my_data/whd_whisard.csv"
@@ -123,9 +144,10 @@ approved_only = h2a.loc[((h2a.status == "CERTIFICATION") | (h2a.status == "PARTI
 print('*** Filtered to certified and partially certified applications***')
 
 # make new "name" columns for the cleaned versions of the names
-approved_only["name"] = [clean_names(one) for one in approved_only.EMPLOYER_NAME]
+name_cleaner = NameCleaner(legal_suffix="strip_period", memo_dir=args.name_memo_dir)
+approved_only["name"] = name_cleaner.clean(approved_only.EMPLOYER_NAME)
 approved_only_pure = approved_only.copy()
-investigations["name"] = [clean_names(one) for one in investigations.legal_name]
+investigations["name"] = name_cleaner.clean(investigations.legal_name)
 investigations_cleaned = investigations.loc[investigations.name != "NAN", :].copy()     # get rid of NAN names
 print('*** Cleaned Names in WHD investigations data ***')
 
@@ -133,9 +155,11 @@ print('*** Converting ld_dt to datetime ***')
 investigations_cleaned['ld_dt'] = pd.to_datetime(investigations_cleaned['ld_dt'], errors='coerce')
 print('*** Converted ld_dt to datetime ***')
 
-# relevant investigations are those after 2017
-print('*** Subsetting to only investigations after 2017-01-01 ***')
-relevant_investigations = investigations_cleaned[investigations_cleaned.ld_dt > '2017-01-01'].copy()
+# relevant investigations are those from the year before the earliest disclosure year on
+# (after 2017-01-01 for the 2018 data)
+investigations_start = str(min(args.years) - 1) + '-01-01'
+print('*** Subsetting to only investigations after %s ***' % investigations_start)
+relevant_investigations = investigations_cleaned[investigations_cleaned.ld_dt > investigations_start].copy()
 
 # Clean up the city names
 print('*** Cleaning up City Names in both Datasets ***')
@@ -151,9 +175,43 @@ colsLeft = ["status", "JOB_START_DATE", "JOB_END_DATE", "EMPLOYER_STATE", "name"
 colsRight = ["st_cd", "name", "h2a_violtn_cnt", "findings_start_date", "findings_end_date",
              "index_dbase2", "city", "ld_dt"]
 
+# candidate pair generators: None is the exhaustive state block, the others only keep
+# pairs in the same state that also share a city prefix / sort near each other by name /
+# share a MinHash LSH bucket of name q-grams
+INDEXERS = {"state_block": None,
+            "state_city": lambda d1, d2: candidate_index.state_city_pairs(d1, d2, blockLeft, blockRight, "city", "city"),
+            "sorted_neighbourhood": lambda d1, d2: candidate_index.sorted_neighbourhood_pairs(d1, d2, "name", "name",
+                                                                                              blockLeft, blockRight),
+            "minhash_lsh": lambda d1, d2: candidate_index.minhash_lsh_pairs(d1, d2, "name", "name",
+                                                                            blockLeft, blockRight,
+                                                                            bands=args.lsh_bands,
+                                                                            rows=args.lsh_rows)}
+
 approved_only.to_csv("../output/approvedOnly.csv")
 res = fuzzy_match(approved_only, relevant_investigations, blockLeft, blockRight, matchingVarsLeft, matchingVarsRight, "jarowinkler",
-                 0.85, colsLeft, colsRight)
+                 0.85, colsLeft, colsRight, n_workers=args.workers, chunk_size=args.chunk_size,
+                 indexer=INDEXERS[args.indexer],
+                 # one saved state per indexer (and LSH setting), since each gives a different match table
+                 state_dir=None if args.incremental_state_dir is None else os.path.join(
+                     args.incremental_state_dir,
+                     args.indexer + ("_%sx%s" % (args.lsh_bands, args.lsh_rows) if args.indexer == "minhash_lsh" else "")),
+                 keyLeft=["CASE_NUMBER", "data_source"], keyRight="case_id")
+
+# compare the indexers against the matches from the full state block
+if args.evaluate_indexers:
+    if args.indexer == "state_block":
+        # res already holds the state block matches (incremental runs give the same ones)
+        true_left, true_right = res.index_dbase1, res.index_dbase2
+    else:
+        true_matches, _ = link_blocks(approved_only, relevant_investigations, blockLeft, blockRight, matchingVarsLeft,
+                                      matchingVarsRight, "jarowinkler", 0.85, n_workers=args.workers,
+                                      chunk_size=args.chunk_size)
+        true_left, true_right = true_matches.index.get_level_values(0), true_matches.index.get_level_values(1)
+    indexer_eval = candidate_index.evaluate_indexers(
+        approved_only, relevant_investigations, blockLeft, blockRight,
+        {name: indexer for name, indexer in INDEXERS.items() if indexer is not None},
+        approved_only.index.get_indexer(true_left), relevant_investigations.index.get_indexer(true_right))
+    indexer_eval.to_csv("../output/indexerEvaluation.csv")
 
 # Update this at some point to provide a unique file name so we don't overwrite files
 csv_path = '../output/fuzzyMatchResult.csv'
@@ -21,41 +21,55 @@ def find_pattern(string, pat):
     else:
         return False
 
-# finds the most occuring item in the column
-def find_mode(col_of_interest):
-    list_version = list(col_of_interest.values)
-    values = sorted(list_version, key = list_version.count, reverse=True)  ## sorted the adj_only list in descending order
-    values_no_dups = list(dict.fromkeys(values))                           ## remove duplicates while preserving order to get top 5
-    return values_no_dups[0]
-
-
-# forms a representative application dataframe by using an assigned technique based on the column data type
+# finds the most occuring item of a column within each group in one pass: (group, value) pairs are
+# counted with a hash (factorize) + np.unique instead of sorting by list.count, and ties go to
+# the value that shows up first in the group (as before). group_codes are 0..n_groups-1
+def group_modes(col_of_interest, group_codes, n_groups):
+    value_codes, values = pd.factorize(col_of_interest, use_na_sentinel=False)
+    n_values = max(len(values), 1)
+    pair_codes = group_codes.astype(np.int64) * n_values + value_codes
+    unique_pairs, first_pos, counts = np.unique(pair_codes, return_index=True, return_counts=True)
+    pair_groups = unique_pairs // n_values
+    # per group: highest count first, then earliest first occurrence
+    order = np.lexsort((first_pos, -counts, pair_groups))
+    is_first = np.r_[True, pair_groups[order][1:] != pair_groups[order][:-1]]
+    best = order[is_first]
+    modes = np.empty(n_groups, dtype=object)
+    # (the value itself is read off its first row, so None stays None)
+    modes[pair_groups[best]] = col_of_interest.to_numpy(dtype=object)[first_pos[best]]
+    return modes
+
+
+# forms a representative application dataframe by using an assigned technique based on the column data type,
+# one row per value of col_to_groupby (in order of first appearance), all groups at once:
+# mean for int64/float64 columns, most common value for object columns, and for datetime columns
+# the earliest START / latest END date (earliest for other dates)
 def form_representative(df, col_to_groupby):
     print('**** FORMING REPS ****')
-    list_of_reps = []
-    for one in df[col_to_groupby].unique():
-        temp_df = df.loc[df[col_to_groupby] == one].copy()
-        to_add = {}
-        for col in temp_df:
-            col_type = df.dtypes[col]
-            if (col_type == "int64"):
-                to_add[col] = temp_df[col].mean(skipna = True)
-            elif (col_type == "object"):
-                to_add[col] = find_mode(temp_df[col])
-            elif (col_type == "float64"):
-                to_add[col] = temp_df[col].mean(skipna = True)
-            elif (col_type == "datetime64[ns]"):
-                if (find_pattern(str(col),r'START')):
-                    to_add[col] = temp_df[col].min()
-                elif (find_pattern(str(col),r'END')):
-                    to_add[col] = temp_df[col].max()
-                else:
-                    to_add[col] = temp_df[col].min()
+    group_codes, groups = pd.factorize(df[col_to_groupby])
+    # (rows with a missing col_to_groupby don't form a group)
+    has_group = group_codes >= 0
+    df, group_codes = df.loc[has_group], group_codes[has_group]
+    n_groups = len(groups)
+
+    to_add = {}
+    for col in df:
+        col_type = df.dtypes[col]
+        if (col_type == "int64") or (col_type == "float64"):
+            to_add[col] = df[col].groupby(group_codes).mean().to_numpy()
+        elif (col_type == "object"):
+            to_add[col] = group_modes(df[col], group_codes, n_groups)
+        elif (col_type == "datetime64[ns]"):
+            if (find_pattern(str(col),r'START')):
+                to_add[col] = df[col].groupby(group_codes).min().to_numpy()
+            elif (find_pattern(str(col),r'END')):
+                to_add[col] = df[col].groupby(group_codes).max().to_numpy()
             else:
-                print("Other type")
-        list_of_reps.append(to_add)
+                to_add[col] = df[col].groupby(group_codes).min().to_numpy()
+        else:
+            print("Other type: %s" % col)
 
-    res = pd.DataFrame(list_of_reps)
+    res = pd.DataFrame(to_add)
     print("**** DONE FORMING REPS *****")
     return res
 
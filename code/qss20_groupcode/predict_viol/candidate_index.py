@@ -0,0 +1,149 @@
+# Authors: JG, DC
+# Purpose: indexing strategies that cut the candidate pairs fuzzy_match has to score,
+#          and a comparison of each against the exhaustive state block
+# Filename: candidate_index.py
+
+# imports
+import time
+import zlib
+
+import numpy as np
+import pandas as pd
+import recordlinkage
+
+# -------- USER DEFINED FUNCTIONS --------
+
+# every indexer returns its candidate pairs as (dbase1 positions, dbase2 positions)
+
+
+# this function turns recordlinkage's (dbase1 index, dbase2 index) pairs into positions
+def _label_pairs_to_positions(candidate_links, dbase1, dbase2):
+    left_pos = dbase1.index.get_indexer(candidate_links.get_level_values(0))
+    right_pos = dbase2.index.get_indexer(candidate_links.get_level_values(1))
+    return left_pos, right_pos
+
+
+# this function builds all pairs of records that share a key (the plain blocking fuzzy_match does)
+def block_pairs(keys1, keys2):
+    left_groups = pd.Series(np.arange(len(keys1))).groupby(np.asarray(keys1)).indices
+    right_groups = pd.Series(np.arange(len(keys2))).groupby(np.asarray(keys2)).indices
+    left_pos, right_pos = [], []
+    for key in left_groups.keys() & right_groups.keys():
+        left_pos.append(np.repeat(left_groups[key], len(right_groups[key])))
+        right_pos.append(np.tile(right_groups[key], len(left_groups[key])))
+    if len(left_pos) == 0:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+    return np.concatenate(left_pos), np.concatenate(right_pos)
+
+
+# this function counts the pairs block_pairs would build without building them
+def block_pair_count(keys1, keys2):
+    counts = pd.concat([pd.Series(np.asarray(keys1)).value_counts().rename("left"),
+                        pd.Series(np.asarray(keys2)).value_counts().rename("right")], axis=1).fillna(0)
+    return int((counts.left * counts.right).sum())
+
+
+# this function blocks on the state plus the first prefix_len letters of the city
+def state_city_pairs(dbase1, dbase2, blockLeft, blockRight, cityLeft, cityRight, prefix_len=3):
+    keys1 = dbase1[blockLeft].astype(str) + "|" + dbase1[cityLeft].astype(str).str[:prefix_len]
+    keys2 = dbase2[blockRight].astype(str) + "|" + dbase2[cityRight].astype(str).str[:prefix_len]
+    return block_pairs(keys1, keys2)
+
+
+# this function pairs records whose names are within window places of each other when the
+# names of both databases are sorted together (within the same state block), using
+# recordlinkage's SortedNeighbourhood index
+def sorted_neighbourhood_pairs(dbase1, dbase2, nameLeft, nameRight, blockLeft, blockRight, window=9):
+    indexer = recordlinkage.Index()
+    indexer.add(recordlinkage.index.SortedNeighbourhood(left_on=nameLeft, right_on=nameRight, window=window,
+                                                        block_left_on=blockLeft, block_right_on=blockRight))
+    return _label_pairs_to_positions(indexer.index(dbase1, dbase2), dbase1, dbase2)
+
+
+# this function computes MinHash signatures of the character q-grams of each name
+def minhash_signatures(names, q=3, num_perm=64, seed=0):
+    names = pd.Series(names).astype(str).to_numpy()
+    # q-grams of every name as (name position, crc32 of the q-gram), padded so short names still have one
+    name_ids, gram_hashes = [], []
+    for i, name in enumerate(names):
+        padded = " " + name + " "
+        grams = {padded[start:start + q] for start in range(max(1, len(padded) - q + 1))}
+        name_ids.extend([i] * len(grams))
+        gram_hashes.extend(zlib.crc32(gram.encode("utf-8")) for gram in grams)
+    name_ids = np.asarray(name_ids, dtype=np.int64)
+    gram_hashes = np.asarray(gram_hashes, dtype=np.uint64)
+
+    # num_perm universal hashes (a * h + b) mod p, minimum per name
+    prime = np.uint64((1 << 31) - 1)
+    rng = np.random.RandomState(seed)
+    a = rng.randint(1, (1 << 31) - 1, size=num_perm).astype(np.uint64)
+    b = rng.randint(0, (1 << 31) - 1, size=num_perm).astype(np.uint64)
+    starts = np.flatnonzero(np.r_[True, name_ids[1:] != name_ids[:-1]])
+    signatures = np.empty((len(names), num_perm), dtype=np.uint64)
+    # a few hash functions at a time to bound the (q-grams x hashes) array
+    for perm_start in range(0, num_perm, 8):
+        perms = slice(perm_start, perm_start + 8)
+        hashed = (gram_hashes[:, None] % prime * a[perms] + b[perms]) % prime
+        signatures[:, perms] = np.minimum.reduceat(hashed, starts, axis=0)
+    return signatures
+
+
+# this function pairs records whose names land in the same bucket in at least one LSH band
+# of their q-gram MinHash signatures (names with q-gram Jaccard similarity above roughly
+# (1 / bands) ** (1 / rows) are likely to), optionally only within the same state block.
+# the default 16 bands x 4 rows puts that threshold at about 0.5: employer names nearly all
+# share q-grams like "FARMS"/"LLC"/"INC", so a lower one (eg 32 x 2, about 0.18) keeps most
+# pairs of a state. more bands / fewer rows trades fewer pairs for recall.
+# signatures are computed once per distinct name
+def minhash_lsh_pairs(dbase1, dbase2, nameLeft, nameRight, blockLeft=None, blockRight=None,
+                      q=3, bands=16, rows=4, seed=0):
+    left_codes, names = pd.factorize(pd.concat([dbase1[nameLeft], dbase2[nameRight]]).astype(str))
+    signatures = minhash_signatures(names, q=q, num_perm=bands * rows, seed=seed)
+    left_name, right_name = left_codes[:len(dbase1)], left_codes[len(dbase1):]
+
+    # distinct name pairs that share a band bucket
+    name_pairs = []
+    in_left = np.zeros(len(names), dtype=bool)
+    in_left[left_name] = True
+    in_right = np.zeros(len(names), dtype=bool)
+    in_right[right_name] = True
+    for band in range(bands):
+        band_keys = pd.util.hash_pandas_object(pd.DataFrame(signatures[:, band * rows:(band + 1) * rows]),
+                                               index=False).to_numpy()
+        buckets = pd.DataFrame({"bucket": band_keys, "name": np.arange(len(names))})
+        name_pairs.append(buckets[in_left].merge(buckets[in_right], on="bucket")[["name_x", "name_y"]])
+    name_pairs = pd.concat(name_pairs).drop_duplicates()
+
+    # expand distinct name pairs back to record pairs
+    left_records = pd.DataFrame({"name_x": left_name, "left_pos": np.arange(len(dbase1))})
+    right_records = pd.DataFrame({"name_y": right_name, "right_pos": np.arange(len(dbase2))})
+    if blockLeft is not None:
+        left_records["block"] = dbase1[blockLeft].to_numpy()
+        right_records["block"] = dbase2[blockRight].to_numpy()
+    pairs = name_pairs.merge(left_records, on="name_x").merge(right_records, on=["name_y"] +
+                                                              (["block"] if blockLeft is not None else []))
+    return pairs.left_pos.to_numpy(), pairs.right_pos.to_numpy()
+
+
+# this function compares indexing strategies against the exhaustive state block:
+# for each strategy (name -> function of (dbase1, dbase2) returning candidate pairs) it reports
+# the number of candidate pairs, the pair reduction ratio (1 - pairs / state block pairs) and
+# the recall of the true matches (the pairs passing fuzzy_match on the full state block,
+# given as dbase1 and dbase2 positions)
+def evaluate_indexers(dbase1, dbase2, blockLeft, blockRight, strategies, true_left_pos, true_right_pos):
+    n_state_pairs = block_pair_count(dbase1[blockLeft], dbase2[blockRight])
+    true_codes = np.asarray(true_left_pos, dtype=np.int64) * len(dbase2) + np.asarray(true_right_pos)
+    rows = []
+    for name, strategy in strategies.items():
+        start = time.time()
+        left_pos, right_pos = strategy(dbase1, dbase2)
+        seconds = time.time() - start
+        candidate_codes = np.unique(np.asarray(left_pos, dtype=np.int64) * len(dbase2) + np.asarray(right_pos))
+        recall = np.isin(true_codes, candidate_codes).mean() if len(true_codes) > 0 else np.nan
+        rows.append({"strategy": name, "pairs": len(candidate_codes),
+                     "reduction_ratio": 1 - len(candidate_codes) / max(n_state_pairs, 1),
+                     "recall": recall, "index_seconds": seconds})
+    res = pd.DataFrame(rows).set_index("strategy")
+    print('*** State block: %s pairs, %s true matches ***' % (n_state_pairs, len(true_codes)))
+    print(res.round(4).to_string())
+    return res
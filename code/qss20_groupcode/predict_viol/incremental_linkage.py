@@ -0,0 +1,116 @@
+# Authors: JG, DC
+# Purpose: incremental fuzzy matching for new disclosure quarters / WHISARD extracts:
+#          only pairs involving new or changed records are scored, the rest of the
+#          match table is carried over from the previous run
+# Filename: incremental_linkage.py
+
+# imports
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+# -------- USER DEFINED FUNCTIONS --------
+
+STATE_FILES = {"left": "left_records.parquet", "right": "right_records.parquet",
+               "matches": "matches.parquet", "config": "config.json"}
+
+
+# this function gives each record a stable key from keyCols (eg CASE_NUMBER and data_source);
+# repeats of the same key are numbered in order, so the key is unique
+def record_keys(dbase, keyCols):
+    keys = dbase[keyCols].astype(str).agg("|".join, axis=1) if isinstance(keyCols, list) else \
+        dbase[keyCols].astype(str)
+    occurrence = keys.groupby(keys.to_numpy()).cumcount().astype(str)
+    return (keys + "#" + occurrence).to_numpy()
+
+
+# this function fingerprints the columns that decide a record's candidate pairs and scores,
+# so a record whose name, city or block changed is re-scored
+def record_fingerprints(dbase, cols):
+    return pd.util.hash_pandas_object(dbase[list(dict.fromkeys(cols))].astype(str), index=False).to_numpy()
+
+
+# this function reads the state saved by the last run (None if there's none or it was
+# saved with different matching options)
+def load_state(state_dir, config):
+    paths = {name: os.path.join(state_dir, file) for name, file in STATE_FILES.items()}
+    if not all(os.path.exists(path) for path in paths.values()):
+        return None
+    with open(paths["config"]) as f:
+        if json.load(f) != config:
+            print('*** Matching options changed since the saved run, rematching everything ***')
+            return None
+    return {name: pd.read_parquet(path) for name, path in paths.items() if name != "config"}
+
+
+# this function saves the records seen and the match table (by record key) for the next run
+def save_state(state_dir, config, left_records, right_records, matches):
+    os.makedirs(state_dir, exist_ok=True)
+    for name, df in [("left", left_records), ("right", right_records), ("matches", matches)]:
+        path = os.path.join(state_dir, STATE_FILES[name])
+        df.to_parquet(path + ".tmp", index=False)
+        os.replace(path + ".tmp", path)
+    with open(os.path.join(state_dir, STATE_FILES["config"]), "w") as f:
+        json.dump(config, f, indent=2)
+
+
+# this function runs link_fn (a function of (dbase1 subset, dbase2 subset) returning compare vectors
+# indexed by (dbase1 index, dbase2 index) for the matching pairs, eg link_blocks) incrementally:
+# with a saved state in state_dir, only new-or-changed left x all right and
+# unchanged left x new-or-changed right are scored; matches between unchanged records are
+# carried over and matches of records that changed or disappeared are dropped.
+# config (the matching options) is saved with the state; if it changes, everything is rematched.
+# this only reproduces a full run if link_fn decides each pair from that pair's two records alone
+# (blocking, state+city blocking, MinHash LSH). an indexer like sorted neighbourhood builds its
+# windows from all the records it's given, so scoring subsets gives different candidate pairs
+# and new records can change which carried-over pairs would still be candidates: don't use it here.
+# returns the compare vectors for the full dbase1 x dbase2 match, like link_fn would
+def link_incremental(dbase1, dbase2, keyLeft, keyRight, fingerprintLeft, fingerprintRight, state_dir, config,
+                     link_fn):
+    left_records = pd.DataFrame({"key": record_keys(dbase1, keyLeft),
+                                 "fingerprint": record_fingerprints(dbase1, fingerprintLeft)})
+    right_records = pd.DataFrame({"key": record_keys(dbase2, keyRight),
+                                  "fingerprint": record_fingerprints(dbase2, fingerprintRight)})
+    state = load_state(state_dir, config)
+
+    if state is None:
+        print('*** No saved linkage state, matching everything ***')
+        compare_vectors = link_fn(dbase1, dbase2)
+    else:
+        # records whose key and fingerprint are both in the saved state are unchanged
+        left_old = pd.MultiIndex.from_frame(left_records).isin(pd.MultiIndex.from_frame(state["left"]))
+        right_old = pd.MultiIndex.from_frame(right_records).isin(pd.MultiIndex.from_frame(state["right"]))
+        print('*** Incremental linkage: %s of %s left and %s of %s right records are new or changed ***' %
+              ((~left_old).sum(), len(left_old), (~right_old).sum(), len(right_old)))
+
+        # carry over the saved matches between unchanged records
+        old_left_pos = pd.Series(np.flatnonzero(left_old), index=left_records.key[left_old])
+        old_right_pos = pd.Series(np.flatnonzero(right_old), index=right_records.key[right_old])
+        carried = state["matches"][state["matches"].key_left.isin(old_left_pos.index) &
+                                   state["matches"].key_right.isin(old_right_pos.index)]
+        carried_vectors = carried.drop(columns=["key_left", "key_right"])
+        carried_vectors.index = pd.MultiIndex.from_arrays(
+            [dbase1.index.to_numpy()[old_left_pos[carried.key_left].to_numpy()],
+             dbase2.index.to_numpy()[old_right_pos[carried.key_right].to_numpy()]])
+
+        # score new left x all right, then old left x new right
+        new_vectors = []
+        if (~left_old).any():
+            new_vectors.append(link_fn(dbase1[~left_old], dbase2))
+        if left_old.any() and (~right_old).any():
+            new_vectors.append(link_fn(dbase1[left_old], dbase2[~right_old]))
+        # (sorted like link_fn's output, so an incremental run gives the rows in the same order as a full one)
+        compare_vectors = pd.concat([carried_vectors] + new_vectors).sort_index()
+        print('*** %s matches carried over, %s from new pairs ***' %
+              (len(carried_vectors), sum(len(vectors) for vectors in new_vectors)))
+
+    # save the full match table by record key for the next run
+    matches = compare_vectors.reset_index(drop=True)
+    matches.insert(0, "key_left", left_records.key.to_numpy()[dbase1.index.get_indexer(
+        compare_vectors.index.get_level_values(0))])
+    matches.insert(1, "key_right", right_records.key.to_numpy()[dbase2.index.get_indexer(
+        compare_vectors.index.get_level_values(1))])
+    save_state(state_dir, config, left_records, right_records, matches)
+    return compare_vectors
@@ -0,0 +1,220 @@
+# Authors: JG, DC
+# Purpose: blocked, parallel scoring of candidate pairs for fuzzy_match in A1_fuzzy_matching.py
+# Filename: linkage_engine.py
+
+# imports
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import recordlinkage
+
+# -------- USER DEFINED FUNCTIONS --------
+
+# data each worker process scores against, set once per worker by _init_worker
+_WORKER = {}
+
+
+def _init_worker(left, right, matchVar1, matchVar2, distFunction, threshold):
+    # each matching variable is compared on its distinct values: the left and right
+    # columns are factorized once, and a pair of records is scored through its pair of codes
+    _WORKER["left_index"] = left.index.to_numpy()
+    _WORKER["right_index"] = right.index.to_numpy()
+    _WORKER["vars"] = []
+    for var1, var2 in zip(matchVar1, matchVar2):
+        left_codes, left_values = pd.factorize(left[var1])
+        right_codes, right_values = pd.factorize(right[var2])
+        compare = recordlinkage.Compare()
+        compare.string(var1, var2, method=distFunction, threshold=threshold, label=var1)
+        # code -1 (missing value) points at the extra NaN row at the end
+        _WORKER["vars"].append({"label": var1, "compare": compare,
+                                "left_codes": np.where(left_codes < 0, len(left_values), left_codes),
+                                "right_codes": np.where(right_codes < 0, len(right_values), right_codes),
+                                "left_values": pd.DataFrame({var1: list(left_values) + [np.nan]}),
+                                "right_values": pd.DataFrame({var2: list(right_values) + [np.nan]})})
+
+
+# this function scores one chunk of (left position, right position) pairs and keeps
+# only the pairs where every matching variable passed the threshold. each variable
+# only scores the distinct value pairs among the pairs that passed the variables before it
+def _score_chunk(left_pos, right_pos):
+    for var in _WORKER["vars"]:
+        if len(left_pos) == 0:
+            break
+        n_right = len(var["right_values"])
+        pair_codes = var["left_codes"][left_pos].astype(np.int64) * n_right + var["right_codes"][right_pos]
+        unique_codes, inverse = np.unique(pair_codes, return_inverse=True)
+        value_pairs = pd.MultiIndex.from_arrays([unique_codes // n_right, unique_codes % n_right])
+        unique_scores = var["compare"].compute(value_pairs, var["left_values"], var["right_values"])
+        passed = unique_scores[var["label"]].to_numpy()[inverse.ravel()] == 1
+        left_pos, right_pos = left_pos[passed], right_pos[passed]
+    # every pair left passed every variable, so its compare vector is all 1s
+    pairs = pd.MultiIndex.from_arrays([_WORKER["left_index"][left_pos], _WORKER["right_index"][right_pos]])
+    return pd.DataFrame({var["label"]: np.ones(len(left_pos)) for var in _WORKER["vars"]}, index=pairs)
+
+
+# this function scores every pair of one shard: either the given left rows x the given
+# right rows of a block (cartesian=True) or the explicit (left, right) position pairs.
+# pairs are scored chunk_size at a time so the compare vectors of a whole block are
+# never held in memory at once
+def _score_shard(block, left_pos, right_pos, cartesian, chunk_size):
+    start = time.time()
+    matches = []
+    if cartesian:
+        n_pairs = len(left_pos) * len(right_pos)
+        rows_per_chunk = max(1, chunk_size // max(len(right_pos), 1))
+        for chunk_start in range(0, len(left_pos), rows_per_chunk):
+            chunk_left = left_pos[chunk_start:chunk_start + rows_per_chunk]
+            matches.append(_score_chunk(np.repeat(chunk_left, len(right_pos)),
+                                        np.tile(right_pos, len(chunk_left))))
+    else:
+        n_pairs = len(left_pos)
+        for chunk_start in range(0, len(left_pos), chunk_size):
+            matches.append(_score_chunk(left_pos[chunk_start:chunk_start + chunk_size],
+                                        right_pos[chunk_start:chunk_start + chunk_size]))
+    return block, n_pairs, time.time() - start, pd.concat(matches)
+
+
+# this function lists the shards to score: one per block shared by both databases,
+# with large blocks split by left rows into shards of about chunk_size pairs
+def block_shards(blocks1, blocks2, chunk_size):
+    left_groups = pd.Series(np.arange(len(blocks1))).groupby(blocks1.to_numpy()).indices
+    right_groups = pd.Series(np.arange(len(blocks2))).groupby(blocks2.to_numpy()).indices
+    shards = []
+    for block in left_groups.keys() & right_groups.keys():
+        left_pos, right_pos = left_groups[block], right_groups[block]
+        rows_per_shard = max(1, chunk_size // len(right_pos))
+        for shard_start in range(0, len(left_pos), rows_per_shard):
+            shards.append((block, left_pos[shard_start:shard_start + rows_per_shard], right_pos, True))
+    return shards
+
+
+# this function lists the shards for explicit candidate pairs (eg from candidate_index.py),
+# grouped by the block label of each pair's left record and split into chunk_size pieces
+def pair_shards(left_pos, right_pos, pair_blocks, chunk_size):
+    shards = []
+    for block, rows in pd.Series(np.arange(len(left_pos))).groupby(np.asarray(pair_blocks)).indices.items():
+        for shard_start in range(0, len(rows), chunk_size):
+            shard_rows = rows[shard_start:shard_start + chunk_size]
+            shards.append((block, left_pos[shard_rows], right_pos[shard_rows], False))
+    return shards
+
+
+# this function scores the shards across a process pool and returns the passing pairs
+# as compare vectors indexed by (dbase1 index, dbase2 index), plus pairs/sec per block
+def _run_shards(shards, dbase1, dbase2, matchVar1, matchVar2, distFunction, threshold,
+                n_workers, chunk_size):
+    left = dbase1[list(dict.fromkeys(matchVar1))]
+    right = dbase2[list(dict.fromkeys(matchVar2))]
+    total_pairs = sum(len(shard[1]) * len(shard[2]) if shard[3] else len(shard[1]) for shard in shards)
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+    print('*** Scoring %s candidate pairs in %s shards with %s worker(s) ***' % (total_pairs, len(shards), n_workers))
+    ## biggest shards first so the pool isn't left waiting on one at the end
+    shards = sorted(shards, key=lambda shard: -(len(shard[1]) * len(shard[2]) if shard[3] else len(shard[1])))
+
+    start = time.time()
+    results = []
+    init_args = (left, right, matchVar1, matchVar2, distFunction, threshold)
+    if n_workers == 1:
+        _init_worker(*init_args)
+        results = [_score_shard(*shard, chunk_size) for shard in shards]
+    else:
+        # fork where available so the calling script (which has no __main__ guard)
+        # isnt re-run inside each worker
+        start_methods = multiprocessing.get_all_start_methods()
+        mp_context = multiprocessing.get_context("fork" if "fork" in start_methods else None)
+        with ProcessPoolExecutor(max_workers=n_workers, mp_context=mp_context,
+                                 initializer=_init_worker, initargs=init_args) as pool:
+            futures = [pool.submit(_score_shard, *shard, chunk_size) for shard in shards]
+            # (results in submission order, not as_completed order, so the output order
+            # doesn't depend on which worker finishes first)
+            results = [future.result() for future in futures]
+
+    # per block throughput (summed over its shards)
+    block_stats = pd.DataFrame([(block, n_pairs, seconds, len(matches))
+                                for block, n_pairs, seconds, matches in results],
+                               columns=["block", "pairs", "seconds", "matches"])
+    block_stats = block_stats.groupby("block").sum().sort_values("pairs", ascending=False)
+    block_stats["pairs_per_sec"] = block_stats.pairs / block_stats.seconds.clip(lower=1e-9)
+    print(block_stats.round(1).to_string())
+    print('*** Scored %s pairs in %.1f sec (%.0f pairs/sec overall) ***' %
+          (total_pairs, time.time() - start, total_pairs / max(time.time() - start, 1e-9)))
+
+    matches = [result[3] for result in results]
+    if len(matches) > 0:
+        # sorted by (dbase1 index, dbase2 index) so serial and parallel runs (and any number
+        # of workers or shard sizes) return the pairs in the same order
+        compare_vectors = pd.concat(matches).sort_index()
+    else:
+        compare_vectors = pd.DataFrame(columns=list(matchVar1),
+                                       index=pd.MultiIndex.from_arrays([[], []]))
+    return compare_vectors, block_stats
+
+
+# this function does the blocked comparison for fuzzy_match across a process pool:
+# candidate pairs are generated and scored block by block (shards of large blocks run on
+# different workers), and only the pairs where every matching variable passes the threshold
+# are returned, as compare vectors indexed by (dbase1 index, dbase2 index).
+# pairs/sec for each block are printed and returned in a second data frame
+def link_blocks(dbase1, dbase2, blockLeft, blockRight, matchVar1, matchVar2, distFunction,
+                threshold, n_workers=None, chunk_size=500000):
+    shards = block_shards(dbase1[blockLeft], dbase2[blockRight], chunk_size)
+    return _run_shards(shards, dbase1, dbase2, matchVar1, matchVar2, distFunction, threshold,
+                       n_workers, chunk_size)
+
+
+# this function scores explicit candidate pairs (positions into dbase1 and dbase2, eg from
+# one of the indexers in candidate_index.py) the same way; throughput is reported per
+# value of blockLeft
+def link_pairs(dbase1, dbase2, left_pos, right_pos, blockLeft, matchVar1, matchVar2, distFunction,
+               threshold, n_workers=None, chunk_size=500000):
+    left_pos, right_pos = np.asarray(left_pos), np.asarray(right_pos)
+    pair_blocks = dbase1[blockLeft].astype(str).to_numpy()[left_pos]
+    shards = pair_shards(left_pos, right_pos, pair_blocks, chunk_size)
+    return _run_shards(shards, dbase1, dbase2, matchVar1, matchVar2, distFunction, threshold,
+                       n_workers, chunk_size)
+
+
+# this function adds suffixes to the columns two frames share, the way pd.merge does
+def _suffix_overlap(left_cols, right_cols, suffixes):
+    overlap = set(left_cols) & set(right_cols)
+    return ([col + suffixes[0] if col in overlap else col for col in left_cols],
+            [col + suffixes[1] if col in overlap else col for col in right_cols])
+
+
+# this function turns the compare vectors into the match table fuzzy_match returns, without
+# touching dbase1/dbase2: the pairs where every variable is 1 are kept, their dbase1/dbase2
+# index labels are read straight off the MultiIndex levels, and colsLeft/colsRight are gathered
+# by position (take) instead of merged on. index_dbase1/index_dbase2 in colsLeft/colsRight
+# refer to the index labels. the columns are named as the two merges used to name them
+# (pd.merge suffixes _x/_y, then _left/_right), so the output matches the old fuzzy_match
+def assemble_matches(compare_vectors, dbase1, dbase2, colsLeft, colsRight):
+    selected = compare_vectors[(compare_vectors == 1).all(axis=1).to_numpy()]
+    left_labels = selected.index.get_level_values(0)
+    right_labels = selected.index.get_level_values(1)
+    left_pos = dbase1.index.get_indexer(left_labels)
+    right_pos = dbase2.index.get_indexer(right_labels)
+    # (labels that aren't in the frames are dropped, like the inner merges did)
+    found = (left_pos >= 0) & (right_pos >= 0)
+    selected, left_pos, right_pos = selected[found], left_pos[found], right_pos[found]
+
+    matches = selected.reset_index(drop=True)
+    matches["index_dbase1"] = left_labels[found]
+    matches["index_dbase2"] = right_labels[found]
+
+    left_cols = [col for col in colsLeft if col != "index_dbase1"]
+    left_part = dbase1[left_cols].take(left_pos).reset_index(drop=True)
+    match_cols, left_part.columns = _suffix_overlap(list(matches.columns), left_cols, ["_x", "_y"])
+    matches.columns = match_cols
+
+    right_cols = [col for col in colsRight if col != "index_dbase2"]
+    right_part = dbase2[right_cols].take(right_pos).reset_index(drop=True)
+    match_cols, right_part.columns = _suffix_overlap(match_cols + list(left_part.columns), right_cols,
+                                                     ["_left", "_right"])
+    matches = pd.concat([matches, left_part, right_part], axis=1)
+    matches.columns = match_cols + list(right_part.columns)
+    return matches
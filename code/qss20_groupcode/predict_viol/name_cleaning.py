@@ -0,0 +1,100 @@
+# Authors: JG, DC
+# Purpose: employer name normalization shared by the fuzzy matching scripts
+#          (the R version for 03/09 is code/name_cleaning.R)
+# Filename: name_cleaning.py
+
+# imports
+import os
+import re
+
+import pandas as pd
+
+# -------- PATTERNS (compiled once) --------
+
+US_STATES = {"AL": "ALABAMA", "AK": "ALASKA", "AZ": "ARIZONA", "AR": "ARKANSAS", "CA": "CALIFORNIA",
+             "CO": "COLORADO", "CT": "CONNECTICUT", "DE": "DELAWARE", "FL": "FLORIDA", "GA": "GEORGIA",
+             "HI": "HAWAII", "ID": "IDAHO", "IL": "ILLINOIS", "IN": "INDIANA", "IA": "IOWA",
+             "KS": "KANSAS", "KY": "KENTUCKY", "LA": "LOUISIANA", "ME": "MAINE", "MD": "MARYLAND",
+             "MA": "MASSACHUSETTS", "MI": "MICHIGAN", "MN": "MINNESOTA", "MS": "MISSISSIPPI",
+             "MO": "MISSOURI", "MT": "MONTANA", "NE": "NEBRASKA", "NV": "NEVADA", "NH": "NEW HAMPSHIRE",
+             "NJ": "NEW JERSEY", "NM": "NEW MEXICO", "NY": "NEW YORK", "NC": "NORTH CAROLINA",
+             "ND": "NORTH DAKOTA", "OH": "OHIO", "OK": "OKLAHOMA", "OR": "OREGON", "PA": "PENNSYLVANIA",
+             "RI": "RHODE ISLAND", "SC": "SOUTH CAROLINA", "SD": "SOUTH DAKOTA", "TN": "TENNESSEE",
+             "TX": "TEXAS", "UT": "UTAH", "VT": "VERMONT", "VA": "VIRGINIA", "WA": "WASHINGTON",
+             "WV": "WEST VIRGINIA", "WI": "WISCONSIN", "WY": "WYOMING"}
+LEGAL_SUFFIXES = ["LLC", "CO", "INC"]
+
+# "- TX", "; TEXAS" etc. (longest alternatives first, so "- ALABAMA" isn't cut to "ABAMA")
+_state_names = sorted(set(US_STATES) | set(US_STATES.values()), key=len, reverse=True)
+STATE_SUFFIX_PATTERN = re.compile("|".join(sep + re.escape(state) for sep in ["- ", "; "] for state in _state_names))
+_suffixes = "|".join(LEGAL_SUFFIXES)
+# LLC/CO/INC followed by a period -> keep the suffix (what A1 has always done)
+LEGAL_SUFFIX_PERIOD_PATTERN = re.compile(r"(" + _suffixes + r")\.")
+# " LLC"/" CO"/" INC" and the &NDASH html artifact -> removed (what 03/09 have always done)
+LEGAL_SUFFIX_DROP_PATTERN = re.compile(r"&NDASH| (" + _suffixes + r")")
+TRAILING_PUNCT_PATTERN = re.compile(r"""[!"#$%&'()*+,\-./:;<=>?@\[\\\]^_`{|}~]+$""")
+
+
+# -------- NAME CLEANER --------
+
+# cleans a column of names over its distinct values only and maps the results back.
+# legal_suffix is "strip_period" (LLC. -> LLC, the default, as A1 did), "drop" (remove
+# " LLC"/" CO"/" INC", as the R scripts do) or None. strip_state_suffix removes "- TX"
+# style state suffixes and strip_trailing_punct trailing punctuation (both as the R scripts do).
+# with memo_dir set, raw -> clean names are kept in a parquet file per set of options there,
+# so names already cleaned in an earlier run aren't cleaned again
+class NameCleaner:
+
+    def __init__(self, legal_suffix="strip_period", strip_state_suffix=False, strip_trailing_punct=False,
+                 memo_dir=None):
+        if legal_suffix not in ("strip_period", "drop", None):
+            raise ValueError("legal_suffix must be 'strip_period', 'drop' or None")
+        self.legal_suffix = legal_suffix
+        self.strip_state_suffix = strip_state_suffix
+        self.strip_trailing_punct = strip_trailing_punct
+        self.memo_dir = memo_dir
+        self.memo = self._load_memo()
+
+    def memo_path(self):
+        options = "names_%s_states%d_punct%d.parquet" % (self.legal_suffix, self.strip_state_suffix,
+                                                         self.strip_trailing_punct)
+        return os.path.join(self.memo_dir, options)
+
+    def _load_memo(self):
+        if self.memo_dir is None or not os.path.exists(self.memo_path()):
+            return {}
+        memo = pd.read_parquet(self.memo_path())
+        return dict(zip(memo.raw, memo.clean))
+
+    def _save_memo(self):
+        os.makedirs(self.memo_dir, exist_ok=True)
+        pd.DataFrame({"raw": list(self.memo.keys()), "clean": list(self.memo.values())}).\
+            to_parquet(self.memo_path() + ".tmp", index=False)
+        os.replace(self.memo_path() + ".tmp", self.memo_path())
+
+    # cleans distinct raw names (strings) with vectorized str ops
+    def clean_unique(self, raw):
+        names = pd.Series(raw, dtype=object).str.upper()
+        if self.strip_state_suffix:
+            names = names.str.replace(STATE_SUFFIX_PATTERN, "", regex=True)
+        if self.legal_suffix == "strip_period":
+            names = names.str.replace(LEGAL_SUFFIX_PERIOD_PATTERN, r"\1", regex=True)
+        elif self.legal_suffix == "drop":
+            names = names.str.replace(LEGAL_SUFFIX_DROP_PATTERN, "", regex=True)
+        if self.strip_trailing_punct:
+            names = names.str.replace(TRAILING_PUNCT_PATTERN, "", regex=True).str.strip()
+        return names.to_numpy()
+
+    # cleans a column of names: missing values become "NAN" (as str(one).upper() did),
+    # each distinct name is cleaned once (or read from the memo) and mapped back
+    def clean(self, col):
+        raw = pd.Series(col).astype(str)
+        codes, uniques = pd.factorize(raw)
+        new_names = [name for name in uniques if name not in self.memo]
+        if len(new_names) > 0:
+            self.memo.update(zip(new_names, self.clean_unique(new_names)))
+            if self.memo_dir is not None:
+                self._save_memo()
+        print('*** Cleaned %s names: %s distinct, %s not seen before ***' % (len(raw), len(uniques), len(new_names)))
+        cleaned = pd.Series([self.memo[name] for name in uniques], dtype=object).to_numpy()[codes]
+        return pd.Series(cleaned, index=pd.Series(col).index)
@@ -0,0 +1,162 @@
+##################
+# Prebuilt point-in-tract lookup index (used by 06)
+# built once per TIGER vintage from the tract shapefiles and saved as numpy
+# arrays, so geocoded jobs can be assigned a GEOID without reloading shapefiles.
+# each vintage is its own memory-mapped index, loaded only when first needed
+##################
+
+import os
+import re
+
+import numpy as np
+import shapely
+from shapely import STRtree
+
+TIGER_TRACT_URL = "https://www2.census.gov/geo/tiger/TIGER{vintage}/TRACT/"
+
+
+def tiger_tract_links(vintage):
+    '''links to every state's tract shapefile zip for a TIGER vintage'''
+    import requests
+    from bs4 import BeautifulSoup
+
+    main_url = TIGER_TRACT_URL.format(vintage=vintage)
+    raw_content = requests.get(main_url).text
+    parsed_content = BeautifulSoup(raw_content, 'html.parser')
+    find_links = parsed_content.findAll("a", attrs = {"href": re.compile("tract")})
+    return [main_url + link.get('href') for link in find_links]
+
+
+def tract_index_path(index_dir, vintage):
+    return os.path.join(index_dir, "tracts_" + str(vintage))
+
+
+def write_tract_index(geoids, geometries, index_path):
+    '''
+    save tract GEOIDs and polygons as flat numpy files: the GEOIDs, each polygon's
+    bounding box, and the polygons as WKB bytes packed into one buffer plus offsets
+    '''
+    os.makedirs(index_path, exist_ok=True)
+    geometries = np.asarray(geometries)
+    wkb = shapely.to_wkb(geometries)
+    offsets = np.zeros(len(wkb) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(one) for one in wkb])
+    np.save(os.path.join(index_path, "geoid.npy"), np.asarray(geoids, dtype="U11"))
+    np.save(os.path.join(index_path, "bounds.npy"), shapely.bounds(geometries))
+    np.save(os.path.join(index_path, "wkb_offsets.npy"), offsets)
+    np.save(os.path.join(index_path, "wkb.npy"), np.frombuffer(b"".join(wkb), dtype=np.uint8))
+
+
+def build_tract_index(vintage, index_dir, shapefile_links=None):
+    '''download (or read) a vintage's tract shapefiles once and write its index'''
+    import geopandas as gpd
+    import pandas as pd
+
+    if shapefile_links is None:
+        shapefile_links = tiger_tract_links(vintage)
+    print("Reading " + str(len(shapefile_links)) + " tract shapefiles for TIGER" + str(vintage))
+    tract_shapes = pd.concat([gpd.read_file(link) for link in shapefile_links])
+    write_tract_index(tract_shapes.GEOID.to_numpy(), tract_shapes.geometry.to_numpy(),
+                      tract_index_path(index_dir, vintage))
+    print("Wrote tract index for TIGER" + str(vintage) + " with " + str(tract_shapes.shape[0]) + " tracts")
+
+
+class TractIndex:
+    '''
+    STRtree over the tract bounding boxes; candidate tracts are then checked exactly
+    against the polygons, which are only decoded from WKB when a point lands in their box.
+    with mmap=True the arrays are memory-mapped rather than read into memory, and the
+    tree is only built on the first lookup
+    '''
+
+    def __init__(self, index_path, mmap=True):
+        mmap_mode = "r" if mmap else None
+        self.geoids = np.load(os.path.join(index_path, "geoid.npy"), mmap_mode=mmap_mode)
+        self.bounds = np.load(os.path.join(index_path, "bounds.npy"), mmap_mode=mmap_mode)
+        self.wkb_offsets = np.load(os.path.join(index_path, "wkb_offsets.npy"), mmap_mode=mmap_mode)
+        self.wkb = np.load(os.path.join(index_path, "wkb.npy"), mmap_mode=mmap_mode)
+        self._tree = None
+
+    @property
+    def tree(self):
+        if self._tree is None:
+            self._tree = STRtree(shapely.box(*np.asarray(self.bounds).T))
+        return self._tree
+
+    def polygons(self, tract_idx):
+        '''decode the polygons for an array of tract positions'''
+        return shapely.from_wkb([self.wkb[self.wkb_offsets[i]:self.wkb_offsets[i + 1]].tobytes()
+                                 for i in tract_idx])
+
+    def lookup(self, lat, lon):
+        '''
+        GEOID of the tract containing each (lat, lon); None for missing coordinates
+        or points outside every tract. coordinates are deduplicated before querying, and a
+        point on a shared boundary gets the first tract in the index
+        '''
+        lat = np.asarray(lat, dtype=float)
+        lon = np.asarray(lon, dtype=float)
+        geoids = np.full(len(lat), None, dtype=object)
+        valid = ~(np.isnan(lat) | np.isnan(lon))
+        if not valid.any():
+            return geoids
+
+        unique_coords, inverse = np.unique(np.column_stack([lon[valid], lat[valid]]),
+                                           axis=0, return_inverse=True)
+        points = shapely.points(unique_coords)
+        point_idx, tract_idx = self.tree.query(points)
+
+        ## exact check against the candidate polygons, decoding each one once
+        candidate_tracts, candidate_pos = np.unique(tract_idx, return_inverse=True)
+        candidate_polygons = self.polygons(candidate_tracts)
+        hits = shapely.intersects(candidate_polygons[candidate_pos], points[point_idx])
+        point_idx, tract_idx = point_idx[hits], tract_idx[hits]
+
+        ## keep the first tract for each point
+        order = np.lexsort((tract_idx, point_idx))
+        point_idx, tract_idx = point_idx[order], tract_idx[order]
+        first_point, first_pos = np.unique(point_idx, return_index=True)
+        unique_geoids = np.full(len(unique_coords), None, dtype=object)
+        unique_geoids[first_point] = self.geoids[tract_idx[first_pos]]
+        geoids[valid] = unique_geoids[inverse.ravel()]
+        return geoids
+
+
+def load_tract_index(index_dir, vintage, mmap=True):
+    return TractIndex(tract_index_path(index_dir, vintage), mmap=mmap)
+
+
+class MultiVintageTractIndex:
+    '''
+    one TractIndex per TIGER vintage, each loaded the first time it's needed.
+    if build_missing, a vintage without a saved index is built (downloading its shapefiles)
+    '''
+
+    def __init__(self, index_dir, build_missing=False):
+        self.index_dir = index_dir
+        self.build_missing = build_missing
+        self.indexes = {}
+
+    def get(self, vintage):
+        if vintage not in self.indexes:
+            if not os.path.exists(tract_index_path(self.index_dir, vintage)):
+                if not self.build_missing:
+                    raise FileNotFoundError("No tract index for TIGER" + str(vintage) +
+                                            " in " + self.index_dir)
+                build_tract_index(vintage, self.index_dir)
+            self.indexes[vintage] = load_tract_index(self.index_dir, vintage)
+        return self.indexes[vintage]
+
+    def lookup(self, lat, lon, vintages):
+        '''
+        GEOID for each (lat, lon) using the tract boundaries of that row's vintage
+        (eg the job's data_source year), in one pass grouped by vintage
+        '''
+        lat = np.asarray(lat, dtype=float)
+        lon = np.asarray(lon, dtype=float)
+        vintages = np.asarray(vintages)
+        geoids = np.full(len(lat), None, dtype=object)
+        for vintage in np.unique(vintages):
+            rows = vintages == vintage
+            geoids[rows] = self.get(int(vintage)).lookup(lat[rows], lon[rows])
+        return geoids